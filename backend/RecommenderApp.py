@@ -1,25 +1,33 @@
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
-from database.db_handler import init_db
+from database.db_handler import init_app, init_db
 from services.recommendations_service import RecommendationService
 from services.content_service import ContentService
 from services.user_service import UserService
 from utils.error_handler import error_response
+from utils.static_assets import StaticAssets
 from flask import request
 import os
 
-app = Flask(__name__, static_folder='../build', static_url_path='')
+# The React build is served by StaticAssets rather than Flask's static route
+app = Flask(__name__, static_folder=None)
 CORS(app)
+init_app(app)
+static_assets = StaticAssets(os.path.join(app.root_path, '..', 'build'))
 
 # For serving the static files from the React app
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        # If the requested file is not found, serve index.html (for client-side routing)
-        return send_from_directory(app.static_folder, 'index.html')
+    # If the requested file is not in the build, serve index.html (for client-side routing);
+    # a missing hashed asset is a 404 so a stale page never loads HTML as a script
+    asset = static_assets.get(path)
+    if asset is None and path.startswith('static/'):
+        return error_response("Asset not found.", 404)
+    asset = asset or static_assets.index
+    if asset is None:
+        return error_response("Frontend build not found.", 404)
+    return static_assets.response(asset, request, app.response_class)
 
 # Initialize service instances
 recommender_service = RecommendationService()
@@ -36,6 +44,14 @@ def handle_exception(e):
 def get_recommendations():
     return recommender_service.get_recommendations()
 
+@app.route('/recommendations/user/<int:user_id>', methods=['GET'])
+def get_user_recommendations(user_id):
+    return recommender_service.get_user_recommendations(user_id)
+
+@app.route('/recommendations/cache', methods=['GET'])
+def recommendations_cache_stats():
+    return recommender_service.get_cache_stats()
+
 # User account endpoints
 @app.route('/create_user', methods=['POST'])
 def create_user():
@@ -48,6 +64,10 @@ def manage_account():
     elif request.method == 'GET':
         return UserService.get_profile_details()
     
+@app.route('/account/metrics', methods=['GET'])
+def auth_metrics():
+    return UserService.get_auth_metrics()
+
 # Profile details endpoints
 @app.route('/update_profile', methods=['POST'])
 def update_profile():
@@ -57,15 +77,20 @@ def update_profile():
 # Content fetching endpoint
 @app.route('/content', methods=['GET'])
 def get_content():
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 20))
+    try:
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return error_response("page and limit must be integers.", 400)
     # Use the proper parameter names as provided by the front end
     search_query = request.args.get('search_query', '').strip()
     content_type = request.args.get('type', '').strip()
     sort_by = request.args.get('sort_by', 'title')
     order = request.args.get('order', 'asc')
+    # Passing cursor (empty for the first page) switches to keyset pagination
+    cursor = request.args.get('cursor')
     
-    return content_service.get_content(page, limit, search_query, content_type, sort_by, order)
+    return content_service.get_content(page, limit, search_query, content_type, sort_by, order, cursor)
 
 @app.route('/search_suggestions', methods=['GET'])
 def search_suggestions():
@@ -80,6 +105,10 @@ def manage_favorites():
     elif request.method == 'DELETE':
         return user_service.remove_from_favorites()
 
+@app.route('/favorites/batch', methods=['POST', 'DELETE'])
+def manage_favorites_batch():
+    return user_service.change_favorites_batch(request.method == 'POST')
+
 @app.route('/favicon.ico')
 def favicon():
     return ('', 204)  # Respond with No Content
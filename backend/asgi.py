@@ -0,0 +1,113 @@
+"""
+ASGI entry point for production serving. Run from the repository root:
+
+    uvicorn asgi:application --app-dir backend --host 0.0.0.0 --port 5000
+
+The event loop owns the sockets, so reading request bodies, writing responses and idle
+keep-alive connections cost no thread. Only the Flask handler itself runs on a thread:
+recommendation scoring (CPU bound) on a pool sized to the CPU count, everything else
+(SQLite, waiting on the bcrypt pool) on a larger I/O pool, so a burst of scoring cannot
+starve content and account requests.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from RecommenderApp import app
+from database.db_handler import init_db
+
+IO_WORKERS = int(os.environ.get('SERVER_IO_WORKERS', 32))
+CPU_WORKERS = int(os.environ.get('SERVER_CPU_WORKERS', os.cpu_count() or 1))
+# Requests under these paths are scored on the CPU pool
+CPU_BOUND_PREFIXES = ('/recommendations',)
+
+io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='io')
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='cpu')
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client_host, client_port = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client_host,
+        'REMOTE_PORT': str(client_port),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name in ('content-length', 'transfer-encoding'):
+            continue  # Framing of the original request; the body below is already de-chunked
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # The body is already buffered, so its length is known even for chunked requests
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+def run_wsgi(environ):
+    # Runs on a pool thread: the whole Flask request, collected into one body
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            init_db(app)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            io_pool.shutdown(wait=True)
+            cpu_pool.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return  # No websocket routes
+
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body.extend(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+
+    pool = cpu_pool if scope['path'].startswith(CPU_BOUND_PREFIXES) else io_pool
+    status, headers, content = await asyncio.get_running_loop().run_in_executor(
+        pool, run_wsgi, wsgi_environ(scope, bytes(body)))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
@@ -1,14 +1,146 @@
+import atexit
+import os
 import sqlite3
+import threading
 from flask import Flask, g
 
 DATABASE = "app.db"
+# Open connections per process; get_db waits up to POOL_TIMEOUT seconds for a free one
+POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", 8))
+POOL_TIMEOUT = float(os.environ.get("DATABASE_POOL_TIMEOUT", 10))
+BUSY_TIMEOUT_MS = int(os.environ.get("DATABASE_BUSY_TIMEOUT_MS", 5000))
+MMAP_SIZE = int(os.environ.get("DATABASE_MMAP_SIZE", 256 * 2**20))
+CACHE_SIZE_KIB = int(os.environ.get("DATABASE_CACHE_KIB", 64 * 1024))
+# Prepared statements kept per connection, keyed by SQL text
+STATEMENT_CACHE_SIZE = 256
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+# Data migrations run once per database, in order; PRAGMA user_version records how many ran.
+# schema.sql only creates missing objects, anything that must touch existing rows goes here.
+MIGRATIONS = [
+    # Build the full-text indexes in bulk for rows inserted before the triggers existed
+    "INSERT INTO movies_fts(movies_fts) VALUES ('rebuild');"
+    "INSERT INTO books_fts(books_fts) VALUES ('rebuild');",
+    # Type existing favourites: an untyped id that exists in both tables was shown as both
+    """
+    CREATE TABLE user_favorites_typed (
+        user_id INTEGER NOT NULL,
+        content_type TEXT NOT NULL CHECK (content_type IN ('movie', 'book')),
+        content_id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, content_type, content_id),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    ) WITHOUT ROWID;
+    INSERT OR IGNORE INTO user_favorites_typed (user_id, content_type, content_id)
+        SELECT uf.user_id, 'movie', uf.content_id FROM user_favorites uf JOIN movies m ON m.id = uf.content_id
+        UNION ALL
+        SELECT uf.user_id, 'book', uf.content_id FROM user_favorites uf JOIN books b ON b.id = uf.content_id;
+    DROP TABLE user_favorites;
+    ALTER TABLE user_favorites_typed RENAME TO user_favorites;
+    """,
+    # Release sorting moved to the comparable key indexed in schema.sql
+    "DROP INDEX IF EXISTS movies_release_date_id;"
+    "DROP INDEX IF EXISTS books_release_date_id;",
+]
+
+def connect(path=DATABASE):
+    db = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,  # Pooled connections move between threads, one user at a time
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    db.row_factory = sqlite3.Row
+    # WAL lets readers run alongside a writer; NORMAL sync is durable at checkpoints and safe in WAL
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    db.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    db.execute("PRAGMA temp_store = MEMORY")
+    db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return db
+
+
+class ConnectionPool:
+    """
+    At most max_size tuned connections to one database file. A released connection is kept
+    for reuse, preferably by the thread that used it last (its page cache and prepared
+    statements are warm for that thread's requests).
+    """
+    def __init__(self, path, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.pid = os.getpid()
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.idle = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("Timed out waiting for a database connection.")
+        try:
+            with self.lock:
+                db = getattr(self.local, "db", None)
+                if db is not None and db in self.idle:
+                    self.idle.remove(db)
+                elif self.idle:
+                    db = self.idle.pop()
+                else:
+                    db = None
+            if db is None:
+                db = connect(self.path)
+            self.local.db = db
+            return db
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, db):
+        try:
+            if db.in_transaction:
+                db.rollback()
+            with self.lock:
+                if self.closed:
+                    db.close()
+                else:
+                    self.idle.append(db)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for db in idle:
+            db.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        # A forked worker must not share its parent's connections
+        if _pool is None or _pool.path != DATABASE or _pool.pid != os.getpid():
+            _pool = ConnectionPool(DATABASE)
+        return _pool
+
+@atexit.register
+def close_pool():
+    if _pool is not None and _pool.pid == os.getpid():
+        _pool.close()
+
 
 def get_db():
+    # One pooled connection per app context, returned by close_db_connection at teardown
     if "db" not in g:
         #print("[DEBUG] Connecting to the database...")  # Debug log
-        g.db = sqlite3.connect(DATABASE, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)  # Allows multithreading  g.db.row_factory = sqlite3.Row
-        g.db.row_factory = sqlite3.Row
-        #print("[DEBUG] Database connection established.")  # Debug log
+        pool = get_pool()
+        g.db = pool.acquire()
+        g.db_pool = pool
     return g.db
 
 
@@ -17,9 +149,14 @@ def init_db(app):
         db = get_db()
         try:
             #print("[DEBUG] Attempting to initialize the database schema...")  # Debug log
-            with open("backend\database\schema.sql", "r") as f:
-                db.executescript(f.read())
+            with open(SCHEMA_PATH, "r") as f:
+                schema = f.read()
+            db.executescript(schema)
             db.commit()
+            if apply_migrations(db):
+                # Migrations may rebuild tables, dropping their triggers; recreate them
+                db.executescript(schema)
+                db.commit()
             #print("[DEBUG] Database schema successfully applied.")  # Debug log
         except FileNotFoundError:
             print("[ERROR] 'schema.sql' file not found.")
@@ -27,9 +164,28 @@ def init_db(app):
             print(f"[ERROR] Database error during initialization: {e}")
 
 
-def close_db_connection(exception):
+def apply_migrations(db):
+    # Runs the pending migrations and returns how many ran
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        db.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
+    return max(0, len(MIGRATIONS) - version)
+
+
+def release_db():
+    # Return this context's connection to the pool early (e.g. before slow non-database work);
+    # a later get_db takes one again
     db = g.pop("db", None)
+    pool = g.pop("db_pool", None)
     if db is not None:
-        print("[DEBUG] Closing the database connection...")  # Debug log
-        db.close()
-        print("[DEBUG] Database connection closed.")  # Debug log
+        #print("[DEBUG] Returning the database connection to the pool...")  # Debug log
+        pool.release(db)
+
+
+def close_db_connection(exception):
+    release_db()
+
+
+def init_app(app):
+    # Return every request's connection to the pool when its app context ends
+    app.teardown_appcontext(close_db_connection)
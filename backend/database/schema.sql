@@ -20,13 +20,15 @@ CREATE TABLE IF NOT EXISTS user_profiles (
 
 
 -- Create User Favorites Table (Tracks personalized recommendations)
+-- Movie and book ids share one integer space, so favourites are keyed by (content_type, content_id).
+-- WITHOUT ROWID clusters the rows on the key: a user's favourites are one covering index range.
 CREATE TABLE IF NOT EXISTS user_favorites (
-    user_id INTEGER,
-    content_id INTEGER,
-    PRIMARY KEY (user_id, content_id),
-    FOREIGN KEY (user_id) REFERENCES users(id),
-    FOREIGN KEY (content_id) REFERENCES contents(id)
-);
+    user_id INTEGER NOT NULL,
+    content_type TEXT NOT NULL CHECK (content_type IN ('movie', 'book')),
+    content_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, content_type, content_id),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+) WITHOUT ROWID;
 
 -- Create Movies and Books Table
 CREATE TABLE IF NOT EXISTS movies (
@@ -55,3 +57,103 @@ CREATE TABLE IF NOT EXISTS books (
     large_cover_url TEXT
 );
 
+
+-- Full-text indexes over title, author and genres (external content: the rows stay in movies/books)
+CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+    title, author, genres,
+    content='movies', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, author, genres,
+    content='books', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+-- Keep the full-text indexes in sync with their content tables
+CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+    INSERT INTO movies_fts(rowid, title, author, genres) VALUES (new.id, new.title, new.author, new.genres);
+END;
+
+CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+    INSERT INTO movies_fts(movies_fts, rowid, title, author, genres) VALUES ('delete', old.id, old.title, old.author, old.genres);
+END;
+
+CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF id, title, author, genres ON movies BEGIN
+    INSERT INTO movies_fts(movies_fts, rowid, title, author, genres) VALUES ('delete', old.id, old.title, old.author, old.genres);
+    INSERT INTO movies_fts(rowid, title, author, genres) VALUES (new.id, new.title, new.author, new.genres);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts(rowid, title, author, genres) VALUES (new.id, new.title, new.author, new.genres);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genres) VALUES ('delete', old.id, old.title, old.author, old.genres);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF id, title, author, genres ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genres) VALUES ('delete', old.id, old.title, old.author, old.genres);
+    INSERT INTO books_fts(rowid, title, author, genres) VALUES (new.id, new.title, new.author, new.genres);
+END;
+
+-- Catalogue version, bumped on every content change so in-process indexes know when to rebuild
+CREATE TABLE IF NOT EXISTS content_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO content_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS movies_version_insert AFTER INSERT ON movies BEGIN
+    UPDATE content_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS movies_version_update AFTER UPDATE ON movies BEGIN
+    UPDATE content_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS movies_version_delete AFTER DELETE ON movies BEGIN
+    UPDATE content_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_version_insert AFTER INSERT ON books BEGIN
+    UPDATE content_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_version_update AFTER UPDATE ON books BEGIN
+    UPDATE content_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_version_delete AFTER DELETE ON books BEGIN
+    UPDATE content_version SET version = version + 1 WHERE id = 1;
+END;
+
+-- Sort indexes for /content listings; id breaks ties so keyset pagination has a total order.
+-- Release dates sort on a text key comparable across both tables (book years are integers,
+-- movie dates ISO strings); the expression must match RELEASE_SORT_KEY in content_service.py.
+CREATE INDEX IF NOT EXISTS movies_title_id ON movies (title, id);
+CREATE INDEX IF NOT EXISTS movies_release_key_id ON movies ((CASE WHEN typeof(release_date) = 'integer' THEN printf('%04d', release_date) ELSE release_date END), id);
+CREATE INDEX IF NOT EXISTS movies_vote_average_id ON movies (vote_average, id);
+
+CREATE INDEX IF NOT EXISTS books_title_id ON books (title, id);
+CREATE INDEX IF NOT EXISTS books_release_key_id ON books ((CASE WHEN typeof(release_date) = 'integer' THEN printf('%04d', release_date) ELSE release_date END), id);
+CREATE INDEX IF NOT EXISTS books_vote_average_id ON books (vote_average, id);
+
+-- Per-user favourites version, bumped in the same transaction as every favourite change,
+-- so cached per-user state (recommendation profiles) can tell when it is stale
+CREATE TABLE IF NOT EXISTS user_favorite_versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS user_favorites_version_insert AFTER INSERT ON user_favorites BEGIN
+    INSERT INTO user_favorite_versions (user_id, version) VALUES (new.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_favorites_version_delete AFTER DELETE ON user_favorites BEGIN
+    INSERT INTO user_favorite_versions (user_id, version) VALUES (old.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
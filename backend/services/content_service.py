@@ -1,89 +1,199 @@
 from database.db_handler import get_db
 from flask import jsonify, request
+from utils.autocomplete import Suggestions
+import base64
+import json
+import re
+
+SEARCH_TOKEN_PATTERN = re.compile(r'\w+')
+MAX_PAGE_SIZE = 100
+# bm25 weights for the indexed columns (title, author, genres)
+SEARCH_COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+# Release dates are movie ISO date strings and book years stored as integers; SQLite orders
+# every integer before every string, so both sort on this text key (years zero-padded,
+# "2001" < "2001-05-03"). It must match the expression indexes in schema.sql exactly.
+RELEASE_SORT_KEY = "(CASE WHEN typeof(release_date) = 'integer' THEN printf('%04d', release_date) ELSE release_date END)"
+
+def fts_match_expression(search_query):
+    """
+    FTS5 MATCH expression for free-text user input: every word must appear, the last one
+    as a prefix so results follow the user's typing. Words are quoted, so characters that
+    mean something in the FTS5 query syntax cannot break the query.
+    """
+    tokens = SEARCH_TOKEN_PATTERN.findall(search_query.lower())
+    if not tokens:
+        return ''
+    return ' '.join([f'"{token}"' for token in tokens[:-1]] + [f'"{tokens[-1]}"*'])
+
+def content_source(table, searching):
+    # The content table, joined to its ranked full-text hits when a search is active
+    if not searching:
+        return table
+    weights = ', '.join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+    return f"""{table} JOIN (
+                        SELECT rowid AS hit_id, bm25({table}_fts, {weights}) AS search_rank
+                        FROM {table}_fts WHERE {table}_fts MATCH ?
+                    ) AS hits ON hits.hit_id = {table}.id"""
+
+def encode_cursor(position):
+    # Opaque to clients: URL-safe base64 of the compact JSON position
+    data = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor.")
+    return position
+
+def seek_ranges(column, descending, value, last_id):
+    """
+    WHERE conditions for the rows after (value, last_id) in ORDER BY column, id, as index ranges
+    to read in order. SQLite sorts NULLs first, so the NULL group precedes every value ascending
+    and follows them descending; an OR across both would scan the index instead of seeking.
+    The range is spelled out rather than as a row value so it also seeks expression indexes.
+    """
+    if not descending:
+        if value is None:
+            return [(f"{column} IS NULL AND id > ?", [last_id]), (f"{column} IS NOT NULL", [])]
+        return [(f"{column} >= ? AND ({column} > ? OR id > ?)", [value, value, last_id])]
+    if value is None:
+        return [(f"{column} IS NULL AND id < ?", [last_id])]
+    return [(f"{column} <= ? AND ({column} < ? OR id < ?)", [value, value, last_id]), (f"{column} IS NULL", [])]
+
+def load_content_version():
+    return get_db().execute("SELECT version FROM content_version WHERE id = 1").fetchone()[0]
+
+def load_suggestion_entries():
+    return get_db().execute("""
+        SELECT title, vote_count FROM movies
+        UNION ALL
+        SELECT title, vote_count FROM books
+    """).fetchall()
 
 class ContentService:
+    # Autocomplete index shared by all requests, rebuilt when content_version changes
+    suggestions = Suggestions(load_content_version, load_suggestion_entries)
+
     @staticmethod
-    def get_content(page=1, limit=20, search_query='', content_type='', sort_by='title', order='asc'):
+    def get_content(page=1, limit=20, search_query='', content_type='', sort_by='title', order='asc', cursor=None):
+        """
+        One page of content. Without a cursor, pages are addressed by number and a list is returned.
+        With a cursor ('' for the first page) the response is {"items": [...], "next_cursor": ...}
+        and each page seeks past the last row of the previous one through the sort indexes,
+        so deep pages cost the same as the first.
+        """
         try:
+            # A zero-row page would hand out a cursor to the same position forever, and a
+            # negative LIMIT is unbounded in SQLite
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}."}), 400
+            if page < 1:
+                return jsonify({"error": "page must be at least 1."}), 400
             db = get_db()
             
             # Validate sorting parameters.
             valid_sort_fields = {
                 "title": "title",
-                "release": "release_date",
+                "release": RELEASE_SORT_KEY,
                 "vote_average": "vote_average"
             }
-            sort_column = valid_sort_fields.get(sort_by, "title")
-            order_clause = "ASC" if order.lower() == "asc" else "DESC"
-            
-            # Compute offset for pagination.
-            offset = (page - 1) * limit
+            if sort_by not in valid_sort_fields:
+                sort_by = "title"
+            sort_column = valid_sort_fields[sort_by]
+            descending = order.lower() != "asc"
+            order_clause = "DESC" if descending else "ASC"
+
+            position = {}
+            if cursor:
+                try:
+                    position = decode_cursor(cursor)
+                except ValueError:
+                    return jsonify({"error": "Invalid cursor."}), 400
+                if position.get("query") != [sort_by, order_clause, search_query]:
+                    return jsonify({"error": "Cursor does not match the requested sort or search."}), 400
 
-            # Build the filter clause for the search query.
-            # (You can extend this if you add more filters later.)
+            # Compute offset for pagination. Searches are ranked by bm25 over all their hits anyway,
+            # so their cursors carry an offset; plain listings seek instead.
+            if cursor is None:
+                offset = (page - 1) * limit
+            else:
+                offset = position.get("offset", 0)
+            seeking = cursor is not None and not search_query
+
+            # Searches go through the full-text index and are ranked by bm25 (lower is better),
+            # the requested sort only breaks ties.
+            # (You can extend filter_clause if you add more filters later.)
             filter_clause = "1=1"
+            rank_clause = ""
             params = []
             if search_query:
-                filter_clause += " AND title LIKE ?"
-                params.append(f"%{search_query}%")
+                match = fts_match_expression(search_query)
+                if not match:
+                    return jsonify([] if cursor is None else {"items": [], "next_cursor": None}), 200
+                rank_clause = "search_rank, "
+                params.append(match)
 
-            # If a specific content type is requested, run only that query.
             if content_type.lower() == 'movie':
-                query = f"""
-                    SELECT id, title, 'Movie' AS type, author, genres, plot, vote_average, vote_count,
-                        release_date, large_cover_url , link 
-                    FROM movies 
-                    WHERE {filter_clause}
-                    ORDER BY {sort_column} {order_clause}
-                    LIMIT ? OFFSET ?
-                """
-                params_with_pagination = params + [limit, offset]
-                results = db.execute(query, params_with_pagination).fetchall()
-                return jsonify([dict(item) for item in results]), 200
-
+                tables = [("movies", "Movie")]
             elif content_type.lower() == 'book':
-                query = f"""
-                    SELECT id, title, 'Book' AS type, author, genres, plot, vote_average, vote_count, 
-                        release_date, large_cover_url , link
-                    FROM books 
-                    WHERE {filter_clause}
-                    ORDER BY {sort_column} {order_clause}
-                    LIMIT ? OFFSET ?
-                """
-                params_with_pagination = params + [limit, offset]
-                results = db.execute(query, params_with_pagination).fetchall()
-                return jsonify([dict(item) for item in results]), 200
-
+                tables = [("books", "Book")]
             else:
-                # When no content_type is provided, get balanced results from both tables.
-                query_movies = f"""
-                    SELECT id, title, 'Movie' AS type, author, genres, plot, vote_average, vote_count, 
-                        release_date, large_cover_url , link
-                    FROM movies 
-                    WHERE {filter_clause}
-                    ORDER BY {sort_column} {order_clause}
-                    LIMIT ? OFFSET ?
-                """
-                query_books = f"""
-                    SELECT id, title, 'Book' AS type, author, genres, plot, vote_average, vote_count, 
-                        release_date, large_cover_url , link
-                    FROM books 
-                    WHERE {filter_clause}
-                    ORDER BY {sort_column} {order_clause}
-                    LIMIT ? OFFSET ?
-                """
-                params_movies = params + [limit, offset]
-                params_books = params + [limit, offset]
-
-                results_movies = db.execute(query_movies, params_movies).fetchall()
-                results_books = db.execute(query_books, params_books).fetchall()
-
-                # Combine the two result sets.
-                # (If you prefer interleaving the two lists instead of concatenation,
-                #  you could loop over the two lists alternately.)
-                combined_results = [dict(item) for item in results_movies] + [dict(item) for item in results_books]
-
-                return jsonify(combined_results), 200
+                tables = [("movies", "Movie"), ("books", "Book")]
+
+            # One query for any mix of types: every branch reads at most the rows the page can use
+            # from its own indexes, and a single ORDER BY/LIMIT merges them. type then id break
+            # ties, since ids are only unique within a table.
+            rank_column = ", search_rank" if search_query else ""
+            after = dict(position.get("after", {}))
+            branches = []
+            branch_params = []
+            for table, label in tables:
+                ranges = [("1=1", [])]
+                if seeking and label in after:
+                    ranges = seek_ranges(sort_column, descending, *after[label])
+                for seek, seek_params in ranges:
+                    branches.append(f"""
+                        SELECT * FROM (
+                            SELECT id, title, '{label}' AS type, author, genres, plot, vote_average, vote_count,
+                                release_date, large_cover_url , link, {sort_column} AS sort_key{rank_column}
+                            FROM {content_source(table, bool(search_query))}
+                            WHERE {filter_clause} AND {seek}
+                            ORDER BY {rank_clause}{sort_column} {order_clause}, id {order_clause}
+                            LIMIT ?
+                        )""")
+                    branch_params += params + seek_params + [offset + limit]
+            query = f"""
+                SELECT id, title, type, author, genres, plot, vote_average, vote_count,
+                    release_date, large_cover_url , link, sort_key
+                FROM ({" UNION ALL ".join(branches)})
+                ORDER BY {rank_clause}sort_key {order_clause}, type {order_clause}, id {order_clause}
+                LIMIT ? OFFSET ?
+            """
+            results = db.execute(query, branch_params + [limit, offset]).fetchall()
+
+            items = [dict(item) for item in results]
+            for item in items:
+                del item["sort_key"]
+            if cursor is None:
+                return jsonify(items), 200
+
+            next_cursor = None
+            if len(results) == limit:
+                next_position = {"query": [sort_by, order_clause, search_query]}
+                if seeking:
+                    # Each type resumes after its last row on this page
+                    for item in results:
+                        after[item["type"]] = [item["sort_key"], item["id"]]
+                    next_position["after"] = after
+                else:
+                    next_position["offset"] = offset + limit
+                next_cursor = encode_cursor(next_position)
+            return jsonify({"items": items, "next_cursor": next_cursor}), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -95,19 +205,7 @@ class ContentService:
             if not search_query:
                 return jsonify([]), 200
 
-            db = get_db()
-            query = """
-                SELECT title FROM (
-                    SELECT title FROM movies WHERE title LIKE ?
-                    UNION ALL
-                    SELECT title FROM books WHERE title LIKE ?
-                ) LIMIT 10
-            """
-            params = (f"%{search_query}%", f"%{search_query}%")
-
-            results = db.execute(query, params).fetchall()
-
-            suggestions = [row["title"] for row in results]
+            suggestions = ContentService.suggestions.search(search_query)
             return jsonify(suggestions), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -1,14 +1,67 @@
-from flask import request, jsonify
-from utils.recommendator import get_balanced_recommendations, load_datasets
+from flask import current_app, request, jsonify
+import json
+import logging
+import threading
+import time
+from utils.recommendator import RELOAD_SECONDS, RecommenderEngine, artifacts_version, normalize_title
+from utils.result_cache import ResultCache
+from utils.user_profiles import UserProfiles
+from services.user_service import UserService
 from database.db_handler import get_db
-import pandas as pd
+
+logger = logging.getLogger(__name__)
 
 class RecommendationService:
     """
     Service layer for handling recommendation.
     """
-    def __init__(self):
-        self.df = load_datasets()
+    RECOMMENDATIONS_PER_TYPE = 12
+
+    def __init__(self, reload_seconds=RELOAD_SECONDS):
+        # Built once per process; holds the DataFrame and embeddings in memory
+        self.engine = RecommenderEngine()
+        self.cache = ResultCache()
+        self.profiles = UserProfiles(self.engine.store)
+        self.reload_seconds = reload_seconds
+        self.checked_at = time.monotonic()
+        self.lock = threading.Lock()
+        UserService.favorite_listeners.append(self.favorite_changed)
+
+    def _current(self):
+        """
+        The engine and the profiles built on its embeddings. The cache manifest's version
+        is polled at most once per reload_seconds; when the artifacts were rebuilt (e.g. by
+        another process) a new engine is loaded off the lock and both are swapped in whole,
+        which also empties the result cache through its version check.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked_at < self.reload_seconds:
+                return self.engine, self.profiles
+            self.checked_at = now
+        version = artifacts_version()
+        if version is None or version == self.engine.version:
+            return self.engine, self.profiles
+        logger.info(f"Recommender artifacts changed to version {version}; reloading.")
+        try:
+            engine = RecommenderEngine()
+        except Exception:
+            # Keep serving the loaded artifacts; the next poll tries again
+            logger.exception("Reloading the recommender failed.")
+            return self.engine, self.profiles
+        profiles = UserProfiles(engine.store)
+        with self.lock:
+            self.engine, self.profiles = engine, profiles
+        return engine, profiles
+
+    @staticmethod
+    def cache_key(titles, k, profile):
+        # Same titles modulo case/punctuation, in any order for profile mode, share an entry
+        seeds = [(normalize_title(t.get("title", "")), (t.get("type") or "").lower()) if isinstance(t, dict)
+                 else (normalize_title(t), "") for t in titles]
+        if profile:
+            seeds = sorted(set(seeds))
+        return (tuple(seeds), k, profile)
 
     def get_recommendations(self):
         try:
@@ -18,17 +71,84 @@ class RecommendationService:
             if not titles or not isinstance(titles, list):
                 return jsonify({"error": "A list of content titles is required."}), 400
 
-            recommendations = []
-            for title in titles:
-                recs = get_balanced_recommendations(title, 12)
-                #print(f"Recommendations for {title}: {recs}")  # Debugging log
-                recommended_contents = self.df[self.df['title'].isin(recs)].copy()
-                recommended_contents = recommended_contents.where(pd.notnull(recommended_contents), None)
-                recommendations.extend(recommended_contents.to_dict(orient='records'))
+            # Entries may be plain titles or {"title": ..., "type": "book"|"movie"};
+            # "profile": true merges all seeds into a single query.
+            profile = bool(data.get("profile", False))
+            k = self.RECOMMENDATIONS_PER_TYPE
+            key = self.cache_key(titles, k, profile)
+            engine, _ = self._current()
+            body = self.cache.get(key, engine.version)
+            if body is not None:
+                return current_app.response_class(body, mimetype="application/json")
 
-            #print("Final Recommendations:", recommendations)  # Debugging log
-            return jsonify(recommendations)
+            rec_rows = engine.balanced_batch_rows(titles, k, profile=profile)
+            # Records are precomputed per catalogue row, so no DataFrame work happens here
+            body = engine.payload(row for rows in rec_rows for row in rows).encode("utf-8")
+            #print("Final Recommendations:", body)  # Debugging log
+            self.cache.put(key, body, len(body), engine.version)
+            return current_app.response_class(body, mimetype="application/json")
 
         except Exception as e:
             #print("Error in get_recommendations:", str(e))  # Debugging log
             return jsonify({"error": str(e)}), 500
+
+    @staticmethod
+    def _content_rows(engine, rows):
+        # Catalogue rows for (title, type) database rows; titles missing from the catalogue are skipped
+        found = (engine.lookup(row["title"], row["type"]) for row in rows)
+        return [idx for idx in found if idx is not None]
+
+    def _favorite_rows(self, engine, user_id):
+        db = get_db()
+        rows = db.execute(
+            """
+            SELECT COALESCE(m.title, b.title) AS title, uf.content_type AS type
+            FROM user_favorites uf
+            LEFT JOIN movies m ON uf.content_type = 'movie' AND m.id = uf.content_id
+            LEFT JOIN books b ON uf.content_type = 'book' AND b.id = uf.content_id
+            WHERE uf.user_id = ? AND COALESCE(m.id, b.id) IS NOT NULL
+            """,
+            (user_id,),
+        ).fetchall()
+        return self._content_rows(engine, rows)
+
+    def _favorites_version(self, user_id):
+        return UserService.favorites_version(get_db(), user_id)
+
+    def favorite_changed(self, user_id, changes, added, version):
+        # Keep cached profile vectors in step with user_favorites, one vector per changed favorite
+        with self.lock:
+            engine, profiles = self.engine, self.profiles
+        db = get_db()
+        rows = []
+        for content_type, table in UserService.CONTENT_TABLES.items():
+            ids = [content_id for change_type, content_id in changes if change_type == content_type]
+            if ids:
+                rows += db.execute(
+                    f"SELECT title, ? AS type FROM {table} WHERE id IN (SELECT value FROM json_each(?))",
+                    (content_type, json.dumps(ids)),
+                ).fetchall()
+        if added:
+            profiles.add(int(user_id), self._content_rows(engine, rows), len(changes), version)
+        else:
+            profiles.remove(int(user_id), self._content_rows(engine, rows), len(changes), version)
+
+    def get_user_recommendations(self, user_id):
+        """
+        Balanced recommendations for a user's stored favorites, scored against their
+        cached profile vector. Items the user already favorited are excluded.
+        """
+        try:
+            engine, profiles = self._current()
+            vector, favorite_rows = profiles.get(user_id, lambda user_id: self._favorite_rows(engine, user_id),
+                                                 self._favorites_version)
+            if vector is None:
+                return jsonify([]), 200
+            rows = engine.balanced_rows_for_vector(vector, self.RECOMMENDATIONS_PER_TYPE, exclude=favorite_rows)
+            return current_app.response_class(engine.payload(rows), mimetype="application/json"), 200
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    def get_cache_stats(self):
+        return jsonify(self.cache.stats()), 200
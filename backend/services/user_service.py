@@ -1,11 +1,33 @@
 from flask import request, jsonify
-from database.db_handler import get_db
-import bcrypt
+from database.db_handler import get_db, release_db
+from utils.password_hasher import HasherBusy, PasswordHasher
 
 class UserService:
     """
     Service layer for handling user account, library, and favorites operations.
     """
+    # bcrypt runs on its own bounded pool, shared by all requests
+    hasher = PasswordHasher()
+
+    # Favorites are keyed by content type; each type's rows live in its own table
+    CONTENT_TABLES = {"movie": "movies", "book": "books"}
+
+    # Called as listener(user_id, changes, added, version) after favorites are actually added or
+    # removed, changes being a list of (content_type, content_id) and version the user's favorites
+    # version right after them (each changed row bumps it by one)
+    favorite_listeners = []
+
+    @staticmethod
+    def _notify_favorite_change(user_id, changes, added, version):
+        for listener in UserService.favorite_listeners:
+            listener(user_id, changes, added, version)
+
+    @staticmethod
+    def favorites_version(db, user_id):
+        # Bumped by triggers in the same transaction as every user_favorites change
+        row = db.execute("SELECT version FROM user_favorite_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row["version"] if row else 0
+
     @staticmethod
     def create_user():
         try:
@@ -17,7 +39,7 @@ class UserService:
                 return jsonify({"error": "Username and password cannot be empty."}), 400
 
             # Hash the password
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            password_hash = UserService.hasher.hash(password)
 
             db = get_db()
             cursor = db.cursor()
@@ -36,10 +58,11 @@ class UserService:
             )
 
             db.commit()
-            db.close()
 
             return jsonify({"message": "User created successfully.", "user_id": user_id}), 201
 
+        except HasherBusy as e:
+            return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -58,19 +81,42 @@ class UserService:
                 "SELECT id, username, password_hash FROM users WHERE username = ?",
                 (username,),
             ).fetchone()
+            # Don't hold a pooled connection while waiting on bcrypt
+            release_db()
 
-            if user is None or not bcrypt.checkpw(password.encode('utf-8'), user["password_hash"].encode('utf-8')):
+            if user is None or not UserService.hasher.verify(password, user["password_hash"]):
                 return jsonify({"error": "Invalid username or password."}), 401
 
+            # Upgrade the stored hash to the configured cost while the password is at hand
+            if UserService.hasher.needs_rehash(user["password_hash"]):
+                try:
+                    password_hash = UserService.hasher.hash(password)
+                except HasherBusy:
+                    password_hash = None  # Retried at the next login
+                if password_hash is not None:
+                    db = get_db()
+                    db.execute(
+                        "UPDATE users SET password_hash = ? WHERE id = ?",
+                        (password_hash, user["id"]),
+                    )
+                    db.commit()
+
             # Return user details including username
             return jsonify({
                 "user_id": user["id"],
                 "username": user["username"]
             }), 200
 
+        except HasherBusy as e:
+            return jsonify({"error": str(e)}), 429, {"Retry-After": "1"}
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    @staticmethod
+    def get_auth_metrics():
+        # Password hashing latency and load shedding, kept apart from other endpoints' timings
+        return jsonify(UserService.hasher.stats()), 200
+
     @staticmethod
     def get_profile():
         try:
@@ -152,7 +198,6 @@ class UserService:
             )
 
             db.commit()
-            db.close()
 
             return jsonify({"message": "Profile updated successfully."}), 200
 
@@ -172,36 +217,86 @@ class UserService:
 
             db = get_db()
 
-            # Fetch favorite movies
-            favorite_movies = db.execute(
+            # One range of the user_favorites key, then one primary-key lookup per favorite
+            favorites = db.execute(
                 """
-                SELECT m.id, m.title, 'Movie' AS type, m.large_cover_url, m.link
+                SELECT uf.content_id AS id,
+                    COALESCE(m.title, b.title) AS title,
+                    CASE uf.content_type WHEN 'movie' THEN 'Movie' ELSE 'Book' END AS type,
+                    COALESCE(m.large_cover_url, b.large_cover_url) AS large_cover_url,
+                    COALESCE(m.link, b.link) AS link
                 FROM user_favorites uf
-                JOIN movies m ON uf.content_id = m.id
-                WHERE uf.user_id = ?
+                LEFT JOIN movies m ON uf.content_type = 'movie' AND m.id = uf.content_id
+                LEFT JOIN books b ON uf.content_type = 'book' AND b.id = uf.content_id
+                WHERE uf.user_id = ? AND COALESCE(m.id, b.id) IS NOT NULL
                 """,
                 (user_id,),
             ).fetchall()
 
-            # Fetch favorite books
-            favorite_books = db.execute(
-                """
-                SELECT b.id, b.title, 'Book' AS type, b.large_cover_url, b.link
-                FROM user_favorites uf
-                JOIN books b ON uf.content_id = b.id
-                WHERE uf.user_id = ?
-                """,
-                (user_id,),
-            ).fetchall()
-
-            # Convert results to list of dictionaries
-            favorites = [dict(item) for item in favorite_movies] + [dict(item) for item in favorite_books]
-
-            return jsonify(favorites), 200
+            return jsonify([dict(item) for item in favorites]), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+    @staticmethod
+    def _favorite_keys(db, items, added):
+        """
+        (content_type, content_id) pairs for {"content_id", "content_type"} items or bare ids.
+        Movie and book ids overlap, so an untyped id is only added when exactly one table has
+        it (clients built before favourites carried a type send bare ids); an untyped remove
+        removes the id under every type.
+        """
+        keys = []
+        for item in items:
+            if isinstance(item, dict):
+                content_id = item.get("content_id")
+                content_type = str(item.get("content_type") or item.get("type") or "").lower()
+            else:
+                content_id, content_type = item, ""
+            if not content_id:
+                raise ValueError("Content ID is required.")
+            content_id = int(content_id)
+            if content_type and content_type not in UserService.CONTENT_TABLES:
+                raise ValueError(f"Unknown content type: {content_type}.")
+
+            if content_type:
+                keys.append((content_type, content_id))
+            elif added:
+                matches = [row["type"] for row in db.execute(
+                    """
+                    SELECT 'movie' AS type FROM movies WHERE id = ?
+                    UNION ALL
+                    SELECT 'book' AS type FROM books WHERE id = ?
+                    """,
+                    (content_id, content_id),
+                )]
+                if len(matches) != 1:
+                    raise ValueError("Content type is required." if matches else "Content not found.")
+                keys.append((matches[0], content_id))
+            else:
+                keys += [(content_type, content_id) for content_type in UserService.CONTENT_TABLES]
+        return keys
+
+    @staticmethod
+    def _change_favorites(user_id, items, added):
+        # Apply all changes in one transaction; returns the (content_type, content_id) pairs that changed
+        db = get_db()
+        keys = UserService._favorite_keys(db, items, added)
+        if added:
+            statement = "INSERT INTO user_favorites (user_id, content_type, content_id) VALUES (?, ?, ?) ON CONFLICT DO NOTHING"
+        else:
+            statement = "DELETE FROM user_favorites WHERE user_id = ? AND content_type = ? AND content_id = ?"
+
+        changes = []
+        with db:
+            for content_type, content_id in keys:
+                if db.execute(statement, (user_id, content_type, content_id)).rowcount:
+                    changes.append((content_type, content_id))
+            # Read inside the write transaction: exactly the version these changes produced
+            version = UserService.favorites_version(db, user_id)
+        if changes:
+            UserService._notify_favorite_change(user_id, changes, added, version)
+        return changes
 
     @staticmethod
     def add_to_favorites():
@@ -213,15 +308,12 @@ class UserService:
             if not user_id or not content_id:
                 return jsonify({"error": "User ID and Content ID are required."}), 400
 
-            db = get_db()
-            db.execute(
-                "INSERT INTO user_favorites (user_id, content_id) VALUES (?, ?) ON CONFLICT DO NOTHING",
-                (user_id, content_id),
-            )
-            db.commit()
+            UserService._change_favorites(user_id, [data], True)
 
             return jsonify({"message": "Content added to favorites."}), 201
 
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -235,14 +327,36 @@ class UserService:
             if not user_id or not content_id:
                 return jsonify({"error": "User ID and Content ID are required."}), 400
 
-            db = get_db()
-            db.execute(
-                "DELETE FROM user_favorites WHERE user_id = ? AND content_id = ?",
-                (user_id, content_id),
-            )
-            db.commit()
+            UserService._change_favorites(user_id, [data], False)
 
             return jsonify({"message": "Content removed from favorites."}), 200
 
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @staticmethod
+    def change_favorites_batch(added):
+        """
+        Add (added=True) or remove many favorites in a single transaction.
+        The body is {"user_id": ..., "items": [{"content_id": ..., "content_type": "movie"|"book"}, ...]}.
+        """
+        try:
+            data = request.json
+            user_id = data.get("user_id")
+            items = data.get("items")
+
+            if not user_id or not items or not isinstance(items, list):
+                return jsonify({"error": "User ID and a list of items are required."}), 400
+
+            changes = UserService._change_favorites(user_id, items, added)
+
+            if added:
+                return jsonify({"message": "Content added to favorites.", "changed": len(changes)}), 201
+            return jsonify({"message": "Content removed from favorites.", "changed": len(changes)}), 200
+
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -0,0 +1,148 @@
+import numpy as np
+import logging
+import os
+import time
+from utils.artifacts import atomic_write
+from utils.embedding_store import Float32Store, normalize_embeddings
+
+logger = logging.getLogger(__name__)
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over L2-normalized embeddings.
+    A spherical k-means coarse quantizer splits the catalogue into lists; a query
+    scores only the items in its n_probe closest lists.
+    """
+    def __init__(self, n_lists=None, n_probe=8):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+        self.n_rows = 0
+
+    def fit(self, embeddings, n_iter=20, sample_size=100000, seed=42):
+        # Train the coarse quantizer on a sample, then assign every row to its closest list
+        n_rows = embeddings.shape[0]
+        if self.n_lists is None:
+            self.n_lists = max(1, min(int(4 * np.sqrt(n_rows)), 4096))
+        self.n_lists = min(self.n_lists, n_rows)
+
+        rng = np.random.default_rng(seed)
+        sample = embeddings
+        if n_rows > sample_size:
+            sample = embeddings[np.sort(rng.choice(n_rows, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample.shape[0], self.n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignments = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=self.n_lists)
+            # Re-seed empty lists with random points so no centroid is wasted
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        assignments = _assign(embeddings, centroids)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_ids = np.argsort(assignments, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=self.n_lists)))).astype(np.int64)
+        self.n_rows = n_rows
+        return self
+
+    def search(self, store, query, k=10, n_probe=None):
+        # Approximate top-k row positions for one normalized query vector, best first
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        candidates = np.concatenate([self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]] for l in probe])
+        if candidates.size == 0:
+            return candidates
+        scores = store.score_rows(candidates, query)
+        k = min(k, candidates.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return candidates[top]
+
+    def save(self, path):
+        with atomic_write(path) as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets,
+                     list_ids=self.list_ids, n_probe=self.n_probe)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(n_lists=data['centroids'].shape[0], n_probe=int(data['n_probe']))
+            index.centroids = data['centroids']
+            index.list_offsets = data['list_offsets']
+            index.list_ids = data['list_ids']
+        index.n_rows = int(index.list_ids.shape[0])
+        return index
+
+def _assign(embeddings, centroids, chunk_size=8192):
+    # Closest centroid (by cosine) for every row, computed in chunks to bound memory
+    assignments = np.empty(embeddings.shape[0], dtype=np.int64)
+    for start in range(0, embeddings.shape[0], chunk_size):
+        chunk = embeddings[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+def load_or_build_index(store, path, n_lists=None, n_probe=8):
+    """
+    Load the persisted IVF index next to the embeddings, rebuilding it when it is
+    missing or was built for a different number of rows.
+    """
+    if os.path.exists(path):
+        try:
+            index = IVFIndex.load(path)
+            if index.n_rows == len(store):
+                index.n_probe = n_probe
+                return index
+            logger.info("ANN index is stale; rebuilding.")
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Could not load ANN index: {e}; rebuilding.")
+    logger.info("Building IVF index.")
+    index = IVFIndex(n_lists=n_lists, n_probe=n_probe).fit(store.dense())
+    index.save(path)
+    return index
+
+def exact_search(embeddings, query, k=10):
+    scores = embeddings @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+def recall_latency_report(embeddings, index, k=10, n_queries=500, n_probes=(1, 2, 4, 8, 16, 32, 64), seed=0):
+    """
+    Compare the IVF index against exact search on random catalogue items.
+    Returns one row per n_probe with recall@k and mean per-query latency in ms.
+    """
+    store = Float32Store(embeddings)
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(embeddings.shape[0], min(n_queries, embeddings.shape[0]), replace=False)]
+
+    start = time.perf_counter()
+    truth = [set(exact_search(embeddings, q, k).tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    report = [{'n_probe': 'exact', 'recall': 1.0, 'latency_ms': exact_ms}]
+    for n_probe in n_probes:
+        if n_probe > index.n_lists:
+            break
+        start = time.perf_counter()
+        results = [index.search(store, q, k, n_probe) for q in queries]
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(truth[i] & set(r.tolist())) / k for i, r in enumerate(results)])
+        report.append({'n_probe': n_probe, 'recall': float(recall), 'latency_ms': latency_ms})
+    return report
+
+if __name__ == "__main__":
+    embeddings = normalize_embeddings(np.load(os.path.join('cache', 'embeddings.npy')))
+    index = load_or_build_index(Float32Store(embeddings), os.path.join('cache', 'ann_ivf.npz'))
+    print(f"{embeddings.shape[0]} items, {index.n_lists} lists")
+    print(f"{'n_probe':>8} {'recall@10':>10} {'ms/query':>10}")
+    for row in recall_latency_report(embeddings, index):
+        print(f"{row['n_probe']:>8} {row['recall']:>10.3f} {row['latency_ms']:>10.3f}")
@@ -0,0 +1,139 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+ARTIFACT_FILE_MODE = 0o644
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _fsync_directory(path):
+    # Persist a rename; directories cannot be opened for syncing on Windows
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+@contextlib.contextmanager
+def atomic_write(path, mode='wb', encoding=None):
+    """
+    Open a temp file next to path for writing. When the block succeeds the file is synced
+    to disk, renamed over path and the rename synced too, so readers never see a partial
+    file and a crash leaves either the old file or the complete new one. On error the
+    temp file is removed and path is left untouched. Every write gets its own temp file,
+    so workers building the same artifact concurrently each rename a complete copy and
+    the last one wins.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        # mkstemp creates the file owner-only; artifacts are read by every worker
+        os.chmod(tmp_path, ARTIFACT_FILE_MODE)
+        with open(fd, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+def atomic_write_json(path, data):
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+def read_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def describe_inputs(input_paths, previous=None):
+    """
+    Content hash, size and mtime of every input file. Files whose size and mtime match
+    the previous manifest reuse its hash, so an unchanged dataset is not re-read on every start.
+    """
+    previous = (previous or {}).get('inputs', {})
+    inputs = {}
+    for name, path in input_paths.items():
+        stat = os.stat(path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        old = previous.get(name)
+        if old and old.get('size') == entry['size'] and old.get('mtime_ns') == entry['mtime_ns']:
+            entry['sha256'] = old['sha256']
+        else:
+            entry['sha256'] = file_sha256(path)
+        inputs[name] = entry
+    return inputs
+
+def artifact_version(manifest):
+    # Short fingerprint of everything that determines the artifacts' contents
+    key = {
+        'inputs': {name: entry['sha256'] for name, entry in manifest['inputs'].items()},
+        'model': manifest['model'],
+        'preprocessing_version': manifest['preprocessing_version'],
+        'rows': manifest['rows'],
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def is_stale(manifest, inputs, model, preprocessing_version):
+    """
+    Reason the cached artifacts no longer match their inputs, or None if they are current.
+    """
+    if manifest is None:
+        return "no manifest"
+    if manifest.get('model') != model:
+        return f"model changed ({manifest.get('model')} -> {model})"
+    if manifest.get('preprocessing_version') != preprocessing_version:
+        return "preprocessing version changed"
+    old_inputs = manifest.get('inputs', {})
+    for name, entry in inputs.items():
+        if old_inputs.get(name, {}).get('sha256') != entry['sha256']:
+            return f"{name} changed"
+    if set(old_inputs) != set(inputs):
+        return "input files changed"
+    return None
+
+def write_manifest(cache_dir, inputs, model, preprocessing_version, rows, embedding_dim):
+    manifest = {
+        'inputs': inputs,
+        'model': model,
+        'preprocessing_version': preprocessing_version,
+        'rows': rows,
+        'embedding_dim': embedding_dim,
+    }
+    manifest['version'] = artifact_version(manifest)
+    atomic_write_json(os.path.join(cache_dir, MANIFEST_FILE), manifest)
+    return manifest
+
+def invalidate(cache_dir, keep=()):
+    """
+    Remove the manifest first, so a crash mid-rebuild is detected on the next start,
+    then every derived artifact except the names in keep.
+    """
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name in keep or not os.path.isfile(path):
+            continue
+        if name.startswith(('embeddings_', 'ann_')):
+            os.remove(path)
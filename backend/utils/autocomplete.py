@@ -0,0 +1,103 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+
+MAX_SUGGESTIONS = 10
+# Short prefixes match huge ranges of keys, so their top suggestions are precomputed;
+# longer prefixes scan their (small) range of the sorted key array
+PRECOMPUTED_PREFIX_LENGTH = 3
+REFRESH_SECONDS = float(os.environ.get('SUGGESTIONS_REFRESH_SECONDS', 30))
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+# Sorts after every character that can follow a prefix in a key
+KEY_END = '\U0010ffff'
+
+def normalize(text):
+    # Same folding as the recommender's title keys: case-folded words joined by single spaces
+    return ' '.join(TOKEN_PATTERN.findall(str(text).casefold()))
+
+def word_starts(normalized):
+    # "the lord of the rings" -> itself, "lord of the rings", "of the rings", "the rings", "rings"
+    words = normalized.split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+class PrefixIndex:
+    """
+    Immutable autocomplete index over titles. Every word-start of a normalized title is a key
+    in one sorted array; a prefix query is a bisect for its key range. Titles are numbered by
+    popularity (vote_count, highest first), so the best suggestions are the smallest numbers.
+    """
+    def __init__(self, entries, limit=MAX_SUGGESTIONS, precomputed_length=PRECOMPUTED_PREFIX_LENGTH):
+        votes = {}
+        for title, vote_count in entries:
+            if title:
+                votes[title] = max(votes.get(title, 0), vote_count or 0)
+        self.titles = sorted(votes, key=lambda title: (-votes[title], title))
+        self.limit = limit
+        self.precomputed_length = precomputed_length
+
+        keyed = []
+        self.top = {}
+        for rank, title in enumerate(self.titles):
+            for key in word_starts(normalize(title)):
+                if not key:
+                    continue
+                keyed.append((key, rank))
+                # Titles arrive in popularity order, so each list fills with the best ones
+                for length in range(1, min(precomputed_length, len(key)) + 1):
+                    ranks = self.top.setdefault(key[:length], [])
+                    if len(ranks) < limit and (not ranks or ranks[-1] != rank):
+                        ranks.append(rank)
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.ranks = [rank for _, rank in keyed]
+
+    def __len__(self):
+        return len(self.titles)
+
+    def search(self, query, limit=MAX_SUGGESTIONS):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if len(prefix) <= self.precomputed_length:
+            ranks = self.top.get(prefix, [])
+        else:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + KEY_END, start)
+            ranks = heapq.nsmallest(limit, set(self.ranks[start:end]))
+        return [self.titles[rank] for rank in ranks[:limit]]
+
+class Suggestions:
+    """
+    Serves a PrefixIndex and rebuilds it when the content changes.
+    load_version() returns a value that changes with the catalogue and load_entries() its
+    (title, vote_count) pairs; the version is polled at most once per refresh_seconds, so
+    lookups in between never leave memory. Rebuilds happen off the lock and swap in whole.
+    """
+    def __init__(self, load_version, load_entries, refresh_seconds=REFRESH_SECONDS):
+        self.load_version = load_version
+        self.load_entries = load_entries
+        self.refresh_seconds = refresh_seconds
+        self.index = None
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.index is not None and now - self.checked_at < self.refresh_seconds:
+                return
+            self.checked_at = now
+        version = self.load_version()
+        if self.index is not None and version == self.version:
+            return
+        index = PrefixIndex(self.load_entries())
+        with self.lock:
+            self.index, self.version = index, version
+
+    def search(self, query, limit=MAX_SUGGESTIONS):
+        self._refresh()
+        return self.index.search(query, limit)
@@ -0,0 +1,244 @@
+import numpy as np
+import hashlib
+import logging
+import os
+from utils.artifacts import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per chunk when a compact matrix has to be upcast for a dot product
+SCORE_CHUNK_ROWS = 16384
+
+def normalize_embeddings(embeddings):
+    # L2-normalize rows once into a contiguous float32 matrix so cosine similarity is a dot product
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+def _take(matrix, rows):
+    # Contiguous row ranges stay views; anything else is copied into a compact block
+    if rows.size and rows[-1] - rows[0] + 1 == rows.size:
+        return matrix[rows[0]:rows[-1] + 1]
+    return np.ascontiguousarray(matrix[rows])
+
+class Float32Store:
+    """
+    Normalized float32 embeddings held in memory. Scores are exact.
+    """
+    exact = True
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def score(self, query):
+        return self.matrix @ query
+
+    def score_rows(self, rows, query):
+        return self.matrix[rows] @ query
+
+    def score_batch(self, queries):
+        return queries @ self.matrix.T
+
+    def vectors(self, rows):
+        # Exact normalized float32 vectors for the given rows
+        return self.matrix[rows]
+
+    def dense(self):
+        return self.matrix
+
+    def take(self, rows):
+        return Float32Store(_take(self.matrix, rows))
+
+class QuantizedStore:
+    """
+    Compact embeddings (float16, or int8 with a per-dimension scale) used for scoring.
+    Exact float32 vectors are read on demand from `source`, normally the memory-mapped
+    embeddings.npy, so only shortlisted rows are ever touched in full precision.
+    """
+    exact = False
+
+    def __init__(self, codes, scale, source, source_rows=None):
+        self.codes = codes
+        self.scale = scale
+        self.source = source
+        self.source_rows = source_rows
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def _query(self, query):
+        # Fold the int8 per-dimension scale into the query instead of dequantizing the matrix
+        query = np.asarray(query, dtype=np.float32)
+        return query * self.scale if self.scale is not None else query
+
+    def score(self, query):
+        query = self._query(query)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_CHUNK_ROWS):
+            chunk = self.codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_CHUNK_ROWS] = chunk @ query
+        return scores
+
+    def score_rows(self, rows, query):
+        return self.codes[rows].astype(np.float32) @ self._query(query)
+
+    def score_batch(self, queries):
+        return np.stack([self.score(query) for query in queries])
+
+    def vectors(self, rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        if self.source_rows is not None:
+            rows = self.source_rows[rows]
+        order = np.argsort(rows)
+        vectors = np.empty((rows.size, self.source.shape[1]), dtype=np.float32)
+        # Read the source in ascending row order, which is kinder to a memory map
+        vectors[order] = normalize_embeddings(self.source[rows[order]])
+        return vectors
+
+    def dense(self):
+        return self.vectors(np.arange(len(self)))
+
+    def take(self, rows):
+        source_rows = self.source_rows[rows] if self.source_rows is not None else rows
+        return QuantizedStore(_take(self.codes, rows), self.scale, self.source, source_rows)
+
+def quantize(normalized, fmt):
+    # (codes, scale) for 'float16' or 'int8'; int8 uses a symmetric per-dimension scale
+    if fmt == 'float16':
+        return normalized.astype(np.float16), None
+    if fmt == 'int8':
+        scale = np.abs(normalized).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        codes = np.clip(np.rint(normalized / scale), -127, 127).astype(np.int8)
+        return codes, scale.astype(np.float32)
+    raise ValueError(f"Unknown embedding format: {fmt}")
+
+def save_array(path, array):
+    with atomic_write(path) as f:
+        np.save(f, array)
+
+def open_array(path, n_rows, mmap=True):
+    # Open a derived array (memory-mapped when asked); None if it is missing or sized for other rows
+    if not os.path.exists(path):
+        return None
+    array = np.load(path, mmap_mode='r' if mmap else None)
+    if array.shape[0] != n_rows:
+        logger.info(f"{os.path.basename(path)} is stale; rebuilding.")
+        return None
+    return array
+
+def load_embedding_store(embeddings, fmt='float32', cache_dir='cache', mmap=True):
+    """
+    Build the store used for search from the raw embeddings (ideally the memory-mapped
+    embeddings.npy). The search matrix for the chosen format is persisted next to it as
+    embeddings_<format>.npy and opened with mmap_mode='r', so every worker on a host
+    shares one page-cache copy. Compact formats rescore shortlists from the raw embeddings.
+    """
+    n_rows = embeddings.shape[0]
+    path = os.path.join(cache_dir, f"embeddings_{fmt}.npy")
+    scale_path = os.path.join(cache_dir, f"embeddings_{fmt}_scale.npy")
+
+    matrix = open_array(path, n_rows, mmap)
+    scale = None
+    if fmt == 'int8':
+        scale = np.load(scale_path) if os.path.exists(scale_path) else None
+    if matrix is None or (fmt == 'int8' and scale is None):
+        logger.info(f"Building {fmt} search embeddings.")
+        os.makedirs(cache_dir, exist_ok=True)
+        normalized = normalize_embeddings(embeddings)
+        if fmt == 'float32':
+            matrix = normalized
+        else:
+            matrix, scale = quantize(normalized, fmt)
+        if scale is not None:
+            save_array(scale_path, scale)
+        save_array(path, matrix)
+        matrix = np.load(path, mmap_mode='r' if mmap else None)
+
+    if fmt == 'float32':
+        return Float32Store(matrix)
+    return QuantizedStore(matrix, scale, embeddings)
+
+def content_keys(texts, model_name):
+    # Hex digest of model name + text per row; the same tags under the same model reuse a vector
+    prefix = model_name.encode('utf-8') + b'\0'
+    return np.array([hashlib.blake2b(prefix + text.encode('utf-8'), digest_size=16).hexdigest()
+                     for text in texts], dtype='S32')
+
+def encode_incremental(texts, model_name, encode, previous=None):
+    """
+    Embeddings for texts, reusing vectors from a previous build whose content key matches
+    and calling encode(list_of_texts) only for new or changed rows. Rows that no longer
+    exist are simply not carried over. previous is (keys, embeddings) or None.
+    Returns (embeddings, keys, number_of_rows_encoded).
+    """
+    keys = content_keys(texts, model_name)
+    reuse_from = np.full(len(texts), -1, dtype=np.intp)
+    if previous is not None:
+        old_keys, old_embeddings = previous
+        old_rows = {key: row for row, key in enumerate(old_keys.tolist())}
+        reuse_from = np.array([old_rows.get(key, -1) for key in keys.tolist()], dtype=np.intp)
+
+    missing = np.flatnonzero(reuse_from < 0)
+    reused = np.flatnonzero(reuse_from >= 0)
+    logger.info(f"Embedding store: reusing {reused.size} vectors, encoding {missing.size}.")
+
+    new_vectors = encode([texts[i] for i in missing]) if missing.size else None
+    dim = new_vectors.shape[1] if new_vectors is not None else previous[1].shape[1]
+    embeddings = np.empty((len(texts), dim), dtype=np.float32)
+    if reused.size:
+        embeddings[reused] = previous[1][reuse_from[reused]]
+    if missing.size:
+        embeddings[missing] = new_vectors
+    return embeddings, keys, missing.size
+
+def memory_recall_report(embeddings, k=10, n_queries=500, rescore_factor=4, seed=0):
+    """
+    Memory footprint and recall@k of each storage format against exact float32 search,
+    scored on the compact matrix alone and after rescoring a k * rescore_factor shortlist.
+    """
+    normalized = normalize_embeddings(embeddings)
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(normalized.shape[0], min(n_queries, normalized.shape[0]), replace=False)
+
+    def top(scores, n):
+        n = min(n, scores.shape[0])
+        idx = np.argpartition(-scores, n - 1)[:n]
+        return idx[np.argsort(-scores[idx])]
+
+    truth = [set(top(normalized @ normalized[q], k).tolist()) for q in queries]
+    report = [{'format': 'float32', 'mb': normalized.nbytes / 2**20, 'recall': 1.0, 'recall_rescored': 1.0}]
+    for fmt in ('float16', 'int8'):
+        codes, scale = quantize(normalized, fmt)
+        store = QuantizedStore(codes, scale, normalized)
+        raw_hits = rescored_hits = 0
+        for q, expected in zip(queries, truth):
+            query = normalized[q]
+            scores = store.score(query)
+            raw_hits += len(expected & set(top(scores, k).tolist()))
+            shortlist = top(scores, k * rescore_factor)
+            exact = store.vectors(shortlist) @ query
+            rescored_hits += len(expected & set(shortlist[top(exact, k)].tolist()))
+        total = k * len(queries)
+        report.append({'format': fmt, 'mb': store.nbytes / 2**20,
+                       'recall': raw_hits / total, 'recall_rescored': rescored_hits / total})
+    return report
+
+if __name__ == "__main__":
+    embeddings = np.load(os.path.join('cache', 'embeddings.npy'))
+    print(f"{embeddings.shape[0]} items x {embeddings.shape[1]} dims")
+    print(f"{'format':>8} {'MB':>8} {'recall@10':>10} {'rescored':>10}")
+    for row in memory_recall_report(embeddings):
+        print(f"{row['format']:>8} {row['mb']:>8.1f} {row['recall']:>10.3f} {row['recall_rescored']:>10.3f}")
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+from utils.artifacts import atomic_write
+from utils.embedding_store import save_array
+
+# Written last, so a directory without it is an incomplete write
+COLUMNS_FILE = 'columns.json'
+# Bump when the on-disk layout changes; older directories count as missing and are rebuilt
+FORMAT_VERSION = 2
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+def _is_text(series):
+    return all(isinstance(value, str) for value in series.dropna().tolist())
+
+def _scalar(value):
+    # numpy scalars -> the matching Python scalar, so they JSON-encode like the originals
+    return value.item() if isinstance(value, np.generic) else value
+
+def save_metadata(df, path):
+    """
+    Store a DataFrame as plain .npy columns instead of a pickle. Numeric columns are
+    saved as-is; text columns as one UTF-8 byte buffer plus row offsets and a null mask,
+    so nothing is unpickled on load. Object columns mixing types (e.g. release_date:
+    book years as ints, movie dates as strings) use the same layout with every value
+    JSON-encoded, so each value loads back with its original type.
+    """
+    os.makedirs(path, exist_ok=True)
+    columns_path = os.path.join(path, COLUMNS_FILE)
+    if os.path.exists(columns_path):
+        os.remove(columns_path)
+
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        if _is_numeric(series):
+            save_array(os.path.join(path, f"{name}.npy"), series.to_numpy())
+            columns.append({'name': name, 'kind': 'numeric'})
+            continue
+        kind = 'text' if _is_text(series) else 'json'
+        encode = str if kind == 'text' else lambda value: json.dumps(_scalar(value))
+        nulls = series.isna().to_numpy()
+        encoded = [b'' if null else encode(value).encode('utf-8') for value, null in zip(series.tolist(), nulls)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        save_array(os.path.join(path, f"{name}.data.npy"), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        save_array(os.path.join(path, f"{name}.offsets.npy"), offsets)
+        save_array(os.path.join(path, f"{name}.null.npy"), nulls)
+        columns.append({'name': name, 'kind': kind})
+
+    with atomic_write(columns_path, 'w', encoding='utf-8') as f:
+        json.dump({'format': FORMAT_VERSION, 'rows': len(df), 'columns': columns}, f)
+
+def metadata_exists(path):
+    # True for a complete directory in the current format
+    try:
+        with open(os.path.join(path, COLUMNS_FILE), encoding='utf-8') as f:
+            return json.load(f).get('format') == FORMAT_VERSION
+    except (OSError, ValueError):
+        return False
+
+def metadata_columns(path):
+    # Column names of a save_metadata directory, in their saved order
+    with open(os.path.join(path, COLUMNS_FILE), encoding='utf-8') as f:
+        return [column['name'] for column in json.load(f)['columns']]
+
+def load_metadata(path, columns=None, mmap=True):
+    """
+    Rebuild the DataFrame from a save_metadata directory, optionally only some columns.
+    With mmap, numeric columns stay memory-mapped and are shared between processes; text
+    and mixed columns are always decoded into Python objects, a private copy in every
+    process, so load only the ones that are needed.
+    """
+    with open(os.path.join(path, COLUMNS_FILE), encoding='utf-8') as f:
+        layout = json.load(f)
+    mmap_mode = 'r' if mmap else None
+
+    data = {}
+    for column in layout['columns']:
+        name = column['name']
+        if columns is not None and name not in columns:
+            continue
+        if column['kind'] == 'numeric':
+            data[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            continue
+        buffer = np.load(os.path.join(path, f"{name}.data.npy"), mmap_mode=mmap_mode).tobytes()
+        offsets = np.load(os.path.join(path, f"{name}.offsets.npy")).tolist()
+        nulls = np.load(os.path.join(path, f"{name}.null.npy")).tolist()
+        decode = json.loads if column['kind'] == 'json' else str
+        data[name] = [None if nulls[i] else decode(buffer[offsets[i]:offsets[i + 1]].decode('utf-8'))
+                      for i in range(layout['rows'])]
+    # copy=False keeps numeric columns backed by their memory maps
+    return pd.DataFrame(data, columns=[c for c in data], copy=False)
@@ -0,0 +1,114 @@
+import numpy as np
+import logging
+import os
+import time
+from utils.embedding_store import open_array, save_array
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOURS_PREFIX = 'neighbours_'
+# Neighbours kept per item and content type; balanced requests use 12 of each
+TABLE_SIZE = 50
+CHUNK_ROWS = 1024
+
+class NeighbourTable:
+    """
+    Precomputed top-N neighbours of every item, per content type, stored as int32 row ids
+    and float16 scores. Rows are tied to the content keys of the build (embedding_keys.npy),
+    so the table keeps working after a dataset refresh: rows are remapped by key, removed
+    items are dropped, and items added after the build return None (score them live).
+    """
+    def __init__(self, keys, ids, scores):
+        self.keys = keys
+        self.ids = ids
+        self.scores = scores
+        self.current_of_build = None
+        self.build_of_current = None
+
+    def save(self, cache_dir):
+        for content_type in self.ids:
+            save_array(os.path.join(cache_dir, f"{NEIGHBOURS_PREFIX}{content_type}_ids.npy"), self.ids[content_type])
+            save_array(os.path.join(cache_dir, f"{NEIGHBOURS_PREFIX}{content_type}_scores.npy"), self.scores[content_type])
+        # Keys last: they mark the table as complete
+        save_array(os.path.join(cache_dir, f"{NEIGHBOURS_PREFIX}keys.npy"), self.keys)
+
+    @classmethod
+    def load(cls, cache_dir, content_types, mmap=True):
+        keys_path = os.path.join(cache_dir, f"{NEIGHBOURS_PREFIX}keys.npy")
+        if not os.path.exists(keys_path):
+            return None
+        keys = np.load(keys_path)
+        ids, scores = {}, {}
+        for content_type in content_types:
+            ids[content_type] = open_array(os.path.join(cache_dir, f"{NEIGHBOURS_PREFIX}{content_type}_ids.npy"), len(keys), mmap)
+            scores[content_type] = open_array(os.path.join(cache_dir, f"{NEIGHBOURS_PREFIX}{content_type}_scores.npy"), len(keys), mmap)
+            if ids[content_type] is None or scores[content_type] is None:
+                return None
+        return cls(keys, ids, scores)
+
+    def attach(self, current_keys):
+        # Map build rows <-> current rows through their content keys
+        if np.array_equal(self.keys, current_keys):
+            self.current_of_build = self.build_of_current = None
+            return self
+        build_rows = {key: row for row, key in enumerate(self.keys.tolist())}
+        current_rows = {key: row for row, key in enumerate(current_keys.tolist())}
+        self.build_of_current = np.array([build_rows.get(key, -1) for key in current_keys.tolist()], dtype=np.intp)
+        self.current_of_build = np.array([current_rows.get(key, -1) for key in self.keys.tolist()], dtype=np.intp)
+        return self
+
+    def lookup(self, row, content_type, k):
+        """
+        Up to k neighbour rows (current positions) of the given type, best first,
+        or None when the item is not in the table or too few neighbours survive.
+        """
+        build_row = row if self.build_of_current is None else self.build_of_current[row]
+        if build_row < 0:
+            return None
+        neighbours = np.asarray(self.ids[content_type][build_row], dtype=np.intp)
+        neighbours = neighbours[neighbours >= 0]
+        if self.current_of_build is not None:
+            neighbours = self.current_of_build[neighbours]
+        neighbours = neighbours[(neighbours >= 0) & (neighbours != row)]
+        if neighbours.size < k:
+            return None
+        return neighbours[:k]
+
+def build_neighbour_table(store, partitions, keys, table_size=TABLE_SIZE, chunk_rows=CHUNK_ROWS):
+    """
+    Exact top-table_size neighbours of every row within each content-type partition.
+    Queries are processed chunk_rows at a time, so at most a (chunk_rows x partition)
+    score block exists at once rather than the full N x N similarity matrix.
+    """
+    n_rows = len(store)
+    ids, scores = {}, {}
+    for content_type, partition in partitions.items():
+        start = time.perf_counter()
+        block = partition.store.dense()
+        k = min(table_size, partition.rows.size - 1)
+        type_ids = np.full((n_rows, table_size), -1, dtype=np.int32)
+        type_scores = np.zeros((n_rows, table_size), dtype=np.float16)
+        for chunk_start in range(0, n_rows, chunk_rows):
+            chunk = np.arange(chunk_start, min(chunk_start + chunk_rows, n_rows))
+            chunk_scores = store.vectors(chunk) @ block.T
+            # An item is never its own neighbour
+            local = partition.local_positions(chunk)
+            in_partition = np.isin(chunk, partition.rows)
+            chunk_scores[np.flatnonzero(in_partition), local] = -np.inf
+            top = np.argpartition(-chunk_scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(chunk_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            type_ids[chunk, :k] = partition.rows[top]
+            type_scores[chunk, :k] = np.take_along_axis(top_scores, order, axis=1)
+        ids[content_type], scores[content_type] = type_ids, type_scores
+        logger.info(f"Neighbour table for {content_type}: {n_rows} x {k} in {time.perf_counter() - start:.1f}s.")
+    return NeighbourTable(keys, ids, scores)
+
+if __name__ == "__main__":
+    from utils.recommendator import BALANCED_TYPES, CACHE_DIR, RecommenderEngine
+    engine = RecommenderEngine()
+    if engine.keys is None:
+        raise SystemExit("embedding_keys.npy is missing; rebuild the cache first.")
+    partitions = {content_type: engine.partitions[content_type] for content_type in BALANCED_TYPES}
+    build_neighbour_table(engine.store, partitions, engine.keys).save(CACHE_DIR)
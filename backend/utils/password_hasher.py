@@ -0,0 +1,108 @@
+import bcrypt
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# bcrypt cost (log2 rounds); changing it rehashes each password at the user's next login
+ROUNDS = int(os.environ.get('AUTH_BCRYPT_ROUNDS', 12))
+WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', 2))
+# Hashes queued or running at once; further requests are shed instead of queued
+MAX_PENDING = int(os.environ.get('AUTH_HASH_QUEUE', 16))
+LATENCY_SAMPLES = 1024
+
+class HasherBusy(Exception):
+    """
+    Raised when the hashing queue is full; the caller should answer 429.
+    """
+
+def hash_rounds(password_hash):
+    # "$2b$12$<salt+hash>" -> 12
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool so password checks never occupy request
+    threads' CPU (bcrypt releases the GIL while hashing). At most max_pending operations
+    are accepted at once, and latency is recorded per operation for /account/metrics.
+    """
+    def __init__(self, rounds=ROUNDS, workers=WORKERS, max_pending=MAX_PENDING):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self.samples = {operation: deque(maxlen=LATENCY_SAMPLES) for operation in ('hash', 'verify')}
+        self.counts = {operation: 0 for operation in self.samples}
+
+    def _run(self, operation, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HasherBusy("Too many authentication requests in progress.")
+        submitted = time.perf_counter()
+        with self.lock:
+            self.pending += 1
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self.lock:
+                    self.pending -= 1
+                    self.counts[operation] += 1
+                    self.samples[operation].append((started - submitted, finished - started))
+                self.slots.release()
+
+        try:
+            future = self.executor.submit(timed)
+        except BaseException:
+            with self.lock:
+                self.pending -= 1
+            self.slots.release()
+            raise
+        return future.result()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run('hash', bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, password_hash):
+        return self._run('verify', bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def stats(self):
+        def summary(samples):
+            if not samples:
+                return {'queue_ms_mean': 0.0, 'hash_ms_p50': 0.0, 'hash_ms_p95': 0.0, 'hash_ms_max': 0.0}
+            waits = sorted(wait for wait, _ in samples)
+            durations = sorted(duration for _, duration in samples)
+            return {
+                'queue_ms_mean': 1000 * sum(waits) / len(waits),
+                'hash_ms_p50': 1000 * durations[len(durations) // 2],
+                'hash_ms_p95': 1000 * durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                'hash_ms_max': 1000 * durations[-1],
+            }
+
+        with self.lock:
+            operations = {operation: {'count': self.counts[operation], **summary(list(samples))}
+                          for operation, samples in self.samples.items()}
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'rejected': self.rejected,
+                'operations': operations,
+            }
@@ -1,89 +1,117 @@
 import pandas as pd
+import json
 import re
 import numpy as np
 import logging
 import os
-import pickle
-import nltk
-from nltk.corpus import stopwords, wordnet
-from nltk.stem import WordNetLemmatizer
-from nltk import pos_tag
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.model_selection import train_test_split
-from sentence_transformers import SentenceTransformer
-
-# Ensure NLTK data is downloaded
-try:
-    stop_words = set(stopwords.words('english'))
-except LookupError:
-    nltk.download('stopwords')
-    stop_words = set(stopwords.words('english'))
-
-try:
-    nltk.data.find('corpora/wordnet')
-except LookupError:
-    nltk.download('wordnet')
-
-try:
-    nltk.data.find('taggers/averaged_perceptron_tagger_eng')
-except LookupError:
-    nltk.download('averaged_perceptron_tagger_eng')
+from utils.embedding_store import encode_incremental, load_embedding_store, open_array, save_array
+from utils.neighbour_table import NeighbourTable
+from utils.metadata_store import load_metadata, metadata_columns, metadata_exists, save_metadata
+from utils.artifacts import describe_inputs, invalidate, is_stale, read_manifest, write_manifest
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 CACHE_DIR = 'cache'
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
+DATASET_FILES = {
+    'popular_books.csv': 'backend/datasets/popular_books.csv',
+    'popular_movies.csv': 'backend/datasets/popular_movies.csv',
+}
+MODEL_NAME = 'all-MiniLM-L6-v2'  # Modify model if desired
+# Bump whenever utils/text_preprocessing.py changes its output, so cached tags and embeddings are rebuilt
+PREPROCESSING_VERSION = 2
+METADATA_DIR = 'metadata'
+# Cached for incremental re-encoding only; text columns are private per-process copies, so serving skips them
+REBUILD_ONLY_COLUMNS = ['tags']
+# Memory-map cached arrays so all workers on a host share one page-cache copy
+USE_MMAP = os.environ.get('RECOMMENDER_MMAP', '1') == '1'
+ANN_INDEX_FILE = 'ann_ivf.npz'
+# 'exact' scans the whole catalogue; 'ivf' uses the approximate index in utils/ann_index.py
+SEARCH_BACKEND = os.environ.get('RECOMMENDER_SEARCH', 'exact')
+ANN_N_PROBE = int(os.environ.get('RECOMMENDER_ANN_PROBE', 8))
+# 'float32', or 'float16' / 'int8' to search compact embeddings and rescore a shortlist in float32
+EMBEDDING_FORMAT = os.environ.get('RECOMMENDER_EMBEDDINGS', 'float32')
+RESCORE_FACTOR = int(os.environ.get('RECOMMENDER_RESCORE_FACTOR', 4))
+BALANCED_TYPES = ('book', 'movie')
+# Seconds between checks of the cache manifest for artifacts rebuilt by another process
+RELOAD_SECONDS = float(os.environ.get('RECOMMENDER_RELOAD_SECONDS', 30))
+TITLE_TOKEN_PATTERN = re.compile(r'[^\W_]+')
+# Heavy dependencies (sentence_transformers/torch, NLTK, scikit-learn) are imported inside the
+# functions that rebuild artifacts, so serving from a prebuilt cache never loads them.
 
 def load_datasets():
     # Load and combine books and movies data
-    df_books = pd.read_csv('backend/datasets/popular_books.csv')
-    df_movies = pd.read_csv('backend/datasets/popular_movies.csv')
+    df_books = pd.read_csv(DATASET_FILES['popular_books.csv'])
+    df_movies = pd.read_csv(DATASET_FILES['popular_movies.csv'])
     df_books['type'] = 'book'
     df_movies['type'] = 'movie'
     df_combined = pd.concat([df_books, df_movies], ignore_index=True)
     df_combined = df_combined[['title', 'author', 'plot', 'genres', 'vote_average', 'vote_count', 'release_date', 'type', 'large_cover_url', 'link']]
     return df_combined
 
-def get_wordnet_pos(word):
-    # Map POS tag to first character lemmatize() accepts
-    tag = pos_tag([word])[0][1][0].upper()
-    tag_dict = {'J': wordnet.ADJ, 'N': wordnet.NOUN,
-                'V': wordnet.VERB, 'R': wordnet.ADV}
-    return tag_dict.get(tag, wordnet.NOUN)
-
-def preprocess_text(text, stop_words, lemmatizer, word_pattern):
-    # Lowercase, tokenize, remove stopwords, lemmatize
-    words = word_pattern.findall(text.lower())
-    words = [w for w in words if w not in stop_words]
-    words = [lemmatizer.lemmatize(w, get_wordnet_pos(w)) for w in words]
-    return ' '.join(words)
-
-def preprocess_content_data(df_combined, stop_words, lemmatizer, word_pattern):
+def preprocess_content_data(df_combined, workers=None):
     # Create and preprocess 'tags' from multiple fields
+    from utils.text_preprocessing import WORKERS, preprocess_texts
+    workers = workers or WORKERS
     df_combined['tags'] = df_combined[['title', 'author', 'genres', 'plot']].fillna('').agg(' '.join, axis=1)
-    df_combined['tags'] = df_combined['tags'].apply(lambda x: preprocess_text(x, stop_words, lemmatizer, word_pattern))
+    df_combined['tags'] = preprocess_texts(df_combined['tags'].tolist(), workers=workers)
     return df_combined
 
 def compute_similarity(X_train, X_test, embeddings):
     # Compute cosine similarity using embeddings
+    from sklearn.metrics.pairwise import cosine_similarity
     train_emb = embeddings[X_train.index]
     test_emb = embeddings[X_test.index]
     cosine_sim = cosine_similarity(test_emb, train_emb)
     return cosine_sim
 
-def get_recommendations(content_title, df_combined, embeddings, k=10):
-    # Recommend top-k similar items
-    try:
-        idx = df_combined[df_combined['title'] == content_title].index[0]
-    except IndexError:
-        logger.warning(f"'{content_title}' not found.")
-        return []
-    scores = cosine_similarity(embeddings[idx].reshape(1, -1), embeddings).flatten()
-    sorted_idx = np.argsort(-scores)
-    top_idx = sorted_idx[sorted_idx != idx][:k]
-    return df_combined.iloc[top_idx][['title', 'type']].to_dict(orient='records')
+def normalize_title(title):
+    # Case-fold and collapse punctuation/whitespace so near-identical titles share a key
+    return ' '.join(TITLE_TOKEN_PATTERN.findall(str(title).casefold()))
+
+def build_title_index(df_combined):
+    """
+    Map normalized titles to row positions, both on their own and paired with the content type.
+    When several rows share a key, the most voted one wins (lowest row on ties), so lookups are deterministic.
+    """
+    keys = df_combined['title'].map(normalize_title).tolist()
+    types = df_combined['type'].tolist()
+    votes = df_combined['vote_count'].fillna(0).tolist()
+
+    # Visit rows from most to least popular so the first row seen for a key is the winner
+    order = sorted(range(len(keys)), key=lambda i: (-votes[i], i))
+    title_index = {}
+    for i in order:
+        title_index.setdefault(keys[i], i)
+        title_index.setdefault((keys[i], types[i]), i)
+    return title_index
+
+def top_k_indices(scores, k):
+    # Indices of the k highest scores, best first, without sorting the whole array
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+def top_k_rows(scores, k):
+    # Row-wise top-k over a (queries x catalogue) score matrix, best first per row
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+def build_records(df_combined):
+    """
+    Serialize every item's response record once, indexed by row position, so responses
+    are assembled by joining strings instead of filtering the DataFrame per request.
+    Keys are sorted and separators compact to match Flask's jsonify output.
+    """
+    columns = [c for c in df_combined.columns if c not in REBUILD_ONLY_COLUMNS]
+    records = df_combined[columns].astype(object).where(pd.notnull(df_combined[columns]), None).to_dict(orient='records')
+    return [json.dumps(record, sort_keys=True, separators=(',', ':')) for record in records]
 
 '''
 
@@ -128,7 +156,7 @@ def evaluate_model(actual, predicted, threshold=5):
 
 def run_recommendation_and_evaluate(content_title, df_combined, embeddings, X_train, X_test, cosine_sim, threshold=5):
     # Get recommendations, predict ratings, evaluate performance
-    recs = get_recommendations(content_title, df_combined, embeddings)
+    recs = get_recommendations(content_title)
     for r in recs:
         logger.info(f"{r['title']} ({r['type'].capitalize()})")
     actual, predicted = predict_ratings(cosine_sim, X_train, X_test)
@@ -147,60 +175,287 @@ def run_recommendation_and_evaluate(content_title, df_combined, embeddings, X_tr
 def initialize_recommender():
     """
     Initialize datasets, preprocess, and prepare embeddings from BERT model.
-    Use caching to load from disk if available.
+    Use caching to load from disk if available. The cache is only trusted when its
+    manifest matches the current dataset hashes, model and preprocessing version;
+    otherwise it is rebuilt, writing every artifact to a temp file and renaming it.
+    Rebuilds only encode rows whose preprocessed tags changed (see encode_incremental).
+    Metadata is kept as plain .npy columns and the embeddings are memory-mapped
+    (RECOMMENDER_MMAP) so workers share one copy. The preprocessed tags are only needed
+    to re-encode, so serving never loads them.
     """
-    df_cache_path = os.path.join(CACHE_DIR, 'df_preprocessed.pkl')
+    meta_dir = os.path.join(CACHE_DIR, METADATA_DIR)
     emb_cache_path = os.path.join(CACHE_DIR, 'embeddings.npy')
+    keys_cache_path = os.path.join(CACHE_DIR, 'embedding_keys.npy')
+
+    manifest = read_manifest(CACHE_DIR)
+    if all(os.path.exists(path) for path in DATASET_FILES.values()):
+        inputs = describe_inputs(DATASET_FILES, manifest)
+        reason = is_stale(manifest, inputs, MODEL_NAME, PREPROCESSING_VERSION)
+    else:
+        # Serving hosts may ship the cache without the source CSVs
+        inputs = None
+        reason = None if manifest else "no manifest and datasets missing"
+    if reason is None and not (metadata_exists(meta_dir) and os.path.exists(emb_cache_path)):
+        reason = "artifacts missing"
 
-    if os.path.exists(df_cache_path) and os.path.exists(emb_cache_path):
+    if reason is None:
         # Load cached data
         #logger.info("Loading preprocessed DataFrame and embeddings from cache.") # Removed for clearer logs
-        with open(df_cache_path, 'rb') as f:
-            df = pickle.load(f)
-        embeddings = np.load(emb_cache_path)
+        df = load_metadata(meta_dir, columns=[c for c in metadata_columns(meta_dir) if c not in REBUILD_ONLY_COLUMNS],
+                           mmap=USE_MMAP)
+        if inputs is not None and inputs != manifest['inputs']:
+            # Same content with new mtimes: refresh them so the next start skips hashing
+            write_manifest(CACHE_DIR, inputs, MODEL_NAME, PREPROCESSING_VERSION, manifest['rows'], manifest['embedding_dim'])
     else:
         # Compute and save
-        logger.info("Cache not found. Loading and preprocessing data.")
+        logger.info(f"Rebuilding cache: {reason}.")
+        # A manifest means the previous build completed, so its keys and vectors line up and can be reused
+        previous = None
+        if manifest is not None and os.path.exists(keys_cache_path) and os.path.exists(emb_cache_path):
+            previous = (np.load(keys_cache_path), np.load(emb_cache_path))
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        invalidate(CACHE_DIR)
         df = load_datasets()
-        lemmatizer = WordNetLemmatizer()
-        pattern = re.compile(r'\b\w+\b')
-        df = preprocess_content_data(df, stop_words, lemmatizer, pattern)
+        df = preprocess_content_data(df)
 
-        logger.info("Generating embeddings with SentenceTransformer.")
-        model = SentenceTransformer('all-MiniLM-L6-v2')  # Modify model if desired
-        embeddings = model.encode(df['tags'].tolist(), show_progress_bar=True)
+        def encode(texts):
+            from sentence_transformers import SentenceTransformer
+            logger.info("Generating embeddings with SentenceTransformer.")
+            model = SentenceTransformer(MODEL_NAME)
+            return model.encode(texts, show_progress_bar=True)
+        embeddings, keys, _ = encode_incremental(df['tags'].tolist(), MODEL_NAME, encode, previous)
 
-        # Save to cache
-        with open(df_cache_path, 'wb') as f:
-            pickle.dump(df, f)
-        np.save(emb_cache_path, embeddings)
+        # Save to cache; the manifest goes last and marks the cache as complete
+        save_array(emb_cache_path, embeddings)
+        save_array(keys_cache_path, keys)
+        save_metadata(df, meta_dir)
+        write_manifest(CACHE_DIR, inputs, MODEL_NAME, PREPROCESSING_VERSION, len(df), embeddings.shape[1])
+        df = df.drop(columns=REBUILD_ONLY_COLUMNS)
 
+    embeddings = np.load(emb_cache_path, mmap_mode='r' if USE_MMAP else None)
     return df, embeddings
 
-def balance_recommendations(recommendations, min_recommendations):
-    # Separate recommendations into books and movies
-    books = [rec for rec in recommendations if rec.get('type') == 'book']
-    movies = [rec for rec in recommendations if rec.get('type') == 'movie']
-    
-    # Determine the balanced minimum length
-    min_length = min(len(books), len(movies), min_recommendations)
-    
-    # Combine an equal number of books and movies
-    balanced_recommendations = books[:min_length] + movies[:min_length]
-    return [rec['title'] for rec in balanced_recommendations]
+def artifacts_version():
+    # Version of the complete cache on disk, or None while it is missing or being rebuilt
+    return (read_manifest(CACHE_DIR) or {}).get('version')
+
+class CatalogPartition:
+    """
+    A subset of catalogue rows (one content type, or everything) with its own
+    embedding store and optional ANN index. Searches return global row positions.
+    """
+    def __init__(self, rows, store, ann_index=None):
+        self.rows = rows
+        self.store = store
+        self.ann_index = ann_index
+
+    def local_positions(self, global_rows):
+        # Positions inside this partition of the given global rows (rows outside it are dropped)
+        global_rows = np.asarray(global_rows, dtype=np.intp).ravel()
+        if global_rows.size == 0 or self.rows.size == 0:
+            return np.empty(0, dtype=np.intp)
+        pos = np.clip(np.searchsorted(self.rows, global_rows), 0, self.rows.size - 1)
+        return pos[self.rows[pos] == global_rows]
+
+    def _rescore(self, candidates, query, k):
+        # Exact float32 ranking of a shortlist scored on compact embeddings
+        if self.store.exact:
+            return candidates[:k]
+        exact = self.store.vectors(candidates) @ query
+        return candidates[top_k_indices(exact, k)]
+
+    def search(self, query, k=10, exclude=()):
+        """
+        Top-k global rows for a normalized query vector, skipping the rows in exclude.
+        Uses the ANN index when present and falls back to an exact scan if it returns too few items.
+        Compact stores return a k * RESCORE_FACTOR shortlist that is rescored in float32.
+        """
+        excluded = self.local_positions(list(exclude))
+        wanted = min(k, self.rows.size - excluded.size)
+        shortlist = wanted if self.store.exact else wanted * RESCORE_FACTOR
+        if self.ann_index is not None:
+            candidates = self.ann_index.search(self.store, query, shortlist + excluded.size)
+            candidates = candidates[~np.isin(candidates, excluded)][:shortlist]
+            if candidates.size >= wanted:
+                return self.rows[self._rescore(candidates, query, wanted)]
+        scores = self.store.score(query)
+        scores[excluded] = -np.inf
+        candidates = top_k_indices(scores, min(shortlist, self.rows.size - excluded.size))
+        return self.rows[self._rescore(candidates, query, wanted)]
+
+    def search_batch(self, queries, k=10, exclude_rows=()):
+        # Top-k global rows for each query row; exclude_rows[i] is skipped for query i
+        if self.ann_index is not None or not self.store.exact:
+            return [self.search(query, k, [row]) for query, row in zip(queries, exclude_rows)]
+        scores = self.store.score_batch(queries)
+        for i, row in enumerate(exclude_rows):
+            scores[i, self.local_positions([row])] = -np.inf
+        wanted = min(k, self.rows.size - 1)
+        return self.rows[top_k_rows(scores, wanted)]
+
+def build_partitions(df_combined, store, search_backend='exact'):
+    """
+    One partition for the whole catalogue plus one per content type, so balanced
+    requests run an exact top-k per type instead of oversampling the full catalogue.
+    """
+    types = df_combined['type'].to_numpy()
+    partitions = {None: (np.arange(len(types), dtype=np.intp), store)}
+    for content_type in BALANCED_TYPES:
+        rows = np.flatnonzero(types == content_type).astype(np.intp)
+        # Contiguous rows (books then movies, as loaded) share memory with the full store
+        partitions[content_type] = (rows, store.take(rows))
+
+    result = {}
+    for content_type, (rows, part_store) in partitions.items():
+        ann_index = None
+        if search_backend == 'ivf' and rows.size:
+            from utils.ann_index import load_or_build_index
+            suffix = f"_{content_type}" if content_type else ''
+            path = os.path.join(CACHE_DIR, ANN_INDEX_FILE.replace('.npz', f"{suffix}.npz"))
+            ann_index = load_or_build_index(part_store, path, n_probe=ANN_N_PROBE)
+        result[content_type] = CatalogPartition(rows, part_store, ann_index)
+    return result
+
+class RecommenderEngine:
+    """
+    Long-lived recommender holding the preprocessed DataFrame and embeddings.
+    Artifacts are loaded once and reused for every request.
+    """
+    def __init__(self, df=None, embeddings=None, search_backend=SEARCH_BACKEND, embedding_format=EMBEDDING_FORMAT):
+        self.version = None
+        self.keys = None
+        if df is None or embeddings is None:
+            df, embeddings = initialize_recommender()
+            # Changes whenever the artifacts are rebuilt from different inputs
+            self.version = artifacts_version()
+            self.keys = open_array(os.path.join(CACHE_DIR, 'embedding_keys.npy'), len(df), mmap=False)
+        self.df = df
+        self.store = load_embedding_store(embeddings, embedding_format, CACHE_DIR, mmap=USE_MMAP)
+        self.title_index = build_title_index(df)
+        self.records = build_records(df)
+        self.partitions = build_partitions(df, self.store, search_backend)
+        self.neighbours = None
+        if self.keys is not None:
+            # Offline table from `python -m utils.neighbour_table`; rows it lacks are scored live
+            table = NeighbourTable.load(CACHE_DIR, BALANCED_TYPES, mmap=USE_MMAP)
+            self.neighbours = table.attach(self.keys) if table is not None else None
+
+    def lookup(self, title, content_type=None):
+        # Row position for a title, optionally restricted to 'book' or 'movie'
+        key = normalize_title(title)
+        if content_type:
+            return self.title_index.get((key, content_type.lower()))
+        return self.title_index.get(key)
+
+    def search(self, query, k=10, exclude=(), target_type=None):
+        # Top-k rows for a normalized query, over the whole catalogue or one content type
+        return self.partitions[target_type].search(query, k, exclude)
+
+    def recommend(self, title, k=10, content_type=None):
+        # Recommend top-k similar items for a single title
+        idx = self.lookup(title, content_type)
+        if idx is None:
+            logger.warning(f"'{title}' not found.")
+            return []
+        top_idx = self.search(self.store.vectors([idx])[0], k, exclude=[idx])
+        return self.df.iloc[top_idx][['title', 'type']].to_dict(orient='records')
+
+    def balanced_recommendations(self, title, min_recommendations, content_type=None):
+        # Equal number of books and movies similar to the given title
+        idx = self.lookup(title, content_type)
+        if idx is None:
+            logger.warning(f"'{title}' not found.")
+            return []
+        rows = np.concatenate([self.recommend_rows([idx], min_recommendations, target_type)[0]
+                               for target_type in BALANCED_TYPES])
+        return self.df['title'].iloc[rows].tolist()
+
+    def resolve(self, titles):
+        # Row positions for a list of titles or {"title", "type"} entries; unknown titles are skipped
+        rows = []
+        for entry in titles:
+            if isinstance(entry, dict):
+                idx = self.lookup(entry.get('title', ''), entry.get('type'))
+            else:
+                idx = self.lookup(entry)
+            if idx is None:
+                logger.warning(f"'{entry}' not found.")
+            else:
+                rows.append(idx)
+        return rows
+
+    def recommend_rows(self, rows, k=10, target_type=None):
+        """
+        Top-k row positions per seed, excluding the seed itself. Seeds found in the
+        neighbour table are a plain lookup; the rest are scored against the catalogue
+        (or one content type) with one matrix product.
+        """
+        if not rows:
+            return np.empty((0, 0), dtype=np.intp)
+        rows = np.asarray(rows, dtype=np.intp)
+        if self.neighbours is None or target_type is None:
+            return self.partitions[target_type].search_batch(self.store.vectors(rows), k, rows)
+
+        results = [self.neighbours.lookup(row, target_type, k) for row in rows]
+        live = [i for i, result in enumerate(results) if result is None]
+        if live:
+            scored = self.partitions[target_type].search_batch(self.store.vectors(rows[live]), k, rows[live])
+            for i, result in zip(live, scored):
+                results[i] = result
+        return results
+
+    def recommend_profile(self, rows, k=10, target_type=None):
+        # Merge the seeds into one centroid query so many favourites cost a single scan
+        if not rows:
+            return np.empty(0, dtype=np.intp)
+        rows = np.unique(np.asarray(rows, dtype=np.intp))
+        centroid = self.store.vectors(rows).mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroid /= norm
+        return self.search(centroid, k, exclude=rows, target_type=target_type)
+
+    def balanced_rows_for_vector(self, query, min_recommendations, exclude=()):
+        # Balanced book/movie rows closest to an arbitrary normalized vector (e.g. a user profile)
+        return np.concatenate([self.search(query, min_recommendations, exclude, target_type)
+                               for target_type in BALANCED_TYPES])
+
+    def balanced_batch_rows(self, titles, min_recommendations, profile=False):
+        """
+        Balanced book/movie recommendations for several titles at once.
+        Returns one array of rows per resolved seed, or a single array in profile mode.
+        """
+        rows = self.resolve(titles)
+        if not rows:
+            return []
+        if profile:
+            per_type = [[self.recommend_profile(rows, min_recommendations, t)] for t in BALANCED_TYPES]
+        else:
+            per_type = [self.recommend_rows(rows, min_recommendations, t) for t in BALANCED_TYPES]
+        return [np.concatenate(seed_rows) for seed_rows in zip(*per_type)]
+
+    def payload(self, rows):
+        # JSON array of the precomputed records for the given rows, in order
+        return '[' + ','.join(self.records[row] for row in rows) + ']'
+
+_engine = None
+
+def get_engine():
+    # Process-wide engine, built on first use
+    global _engine
+    if _engine is None:
+        _engine = RecommenderEngine()
+    return _engine
+
+def get_recommendations(content_title, k=10, content_type=None):
+    # Top-k similar items from the shared engine: normalized title lookup, embeddings normalized once
+    return get_engine().recommend(content_title, k, content_type)
 
 def get_balanced_recommendations(content_title, min_recommendations):
-    
-    #Initialize the recommender
-    df, embeddings = initialize_recommender()
-    
-    # Get recommendations as a list of dictionaries
-    recommendations = get_recommendations(content_title, df, embeddings, min_recommendations * 50)
-    
-    # Balance the recommendations
-    return balance_recommendations(recommendations, min_recommendations)
+    return get_engine().balanced_recommendations(content_title, min_recommendations)
 
 if __name__ == "__main__":
+    from sklearn.model_selection import train_test_split
     df_combined, embeddings = initialize_recommender()
     X_train, X_test = train_test_split(df_combined, test_size=0.2, random_state=42)
     cosine_sim_test_train = compute_similarity(X_train, X_test, embeddings)
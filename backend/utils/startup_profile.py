@@ -0,0 +1,46 @@
+"""
+Startup-time check for serving from prebuilt artifacts.
+
+Run from the repository root after the cache has been built:
+
+    PYTHONPATH=backend python -m utils.startup_profile [budget_seconds]
+
+Times importing the recommender and building the engine, and fails (exit code 1)
+if that exceeds the budget or pulls in a dependency only needed for rebuilds.
+"""
+import sys
+import time
+
+# Only needed to rebuild artifacts; importing any of them while serving is a regression
+REBUILD_ONLY_MODULES = ('torch', 'sentence_transformers', 'nltk', 'sklearn')
+DEFAULT_BUDGET_SECONDS = 5.0
+
+def profile_startup():
+    start = time.perf_counter()
+    from utils.recommendator import RecommenderEngine
+    imported = time.perf_counter()
+    engine = RecommenderEngine()
+    loaded = time.perf_counter()
+    return {
+        'import_seconds': imported - start,
+        'engine_seconds': loaded - imported,
+        'total_seconds': loaded - start,
+        'rows': len(engine.df),
+        'rebuild_modules_loaded': [name for name in REBUILD_ONLY_MODULES if name in sys.modules],
+    }
+
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_SECONDS
+    result = profile_startup()
+    print(f"import recommender: {result['import_seconds'] * 1000:.0f} ms")
+    print(f"build engine:       {result['engine_seconds'] * 1000:.0f} ms ({result['rows']} rows)")
+    print(f"total:              {result['total_seconds'] * 1000:.0f} ms (budget {budget * 1000:.0f} ms)")
+
+    failures = []
+    if result['rebuild_modules_loaded']:
+        failures.append(f"rebuild-only modules imported: {', '.join(result['rebuild_modules_loaded'])}")
+    if result['total_seconds'] > budget:
+        failures.append("startup exceeded the budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,209 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import struct
+import sys
+import zlib
+from utils.artifacts import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Content-hashed build output never changes under its URL
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# index.html and unhashed files (favicon, manifest.json, ...) are revalidated with their ETag
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+HASHED_NAME_PATTERN = re.compile(r'\.[0-9a-f]{8,}\.')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/vnd.ms-fontobject', 'font/ttf', 'image/x-icon', 'image/vnd.microsoft.icon')
+# Source maps are for developer tools only; not worth compressing at startup
+SKIP_COMPRESSION_SUFFIXES = ('.map',)
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+def _brotli():
+    # brotli is optional; without it clients get gzip
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def _gzip_compress(data):
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+def _brotli_compress(data):
+    brotli = _brotli()
+    return brotli.compress(data, quality=BROTLI_QUALITY) if brotli else None
+
+def _gzip_matches(compressed, body):
+    # The gzip trailer holds the CRC-32 and length of the original data
+    if len(compressed) < 18:
+        return False
+    crc, size = struct.unpack('<II', compressed[-8:])
+    return crc == zlib.crc32(body) and size == len(body) & 0xffffffff
+
+def _brotli_matches(compressed, body):
+    brotli = _brotli()
+    if brotli is None:
+        return False
+    try:
+        return brotli.decompress(compressed) == body
+    except brotli.error:
+        return False
+
+# (encoding, sidecar suffix, compress, check that a sidecar holds this body)
+ENCODINGS = (
+    ('br', '.br', _brotli_compress, _brotli_matches),
+    ('gzip', '.gz', _gzip_compress, _gzip_matches),
+)
+
+def _compressible(path, body):
+    content_type = mimetypes.guess_type(path)[0] or ''
+    return (len(body) >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES)
+            and not path.endswith(SKIP_COMPRESSION_SUFFIXES))
+
+def compressed_variants(full_path, body, write=True):
+    """
+    {'br': bytes, 'gzip': bytes} for a build file. A .br/.gz file next to it is used when it
+    holds this exact body; otherwise the variant is compressed and, with write, saved there so
+    later starts and other workers load it instead of compressing again.
+    """
+    variants = {}
+    for encoding, suffix, compress, matches in ENCODINGS:
+        sidecar = full_path + suffix
+        if os.path.exists(sidecar):
+            with open(sidecar, 'rb') as f:
+                data = f.read()
+            if matches(data, body):
+                variants[encoding] = data
+                continue
+        data = compress(body)
+        if data is None:
+            continue
+        variants[encoding] = data
+        if write:
+            try:
+                with atomic_write(sidecar) as f:
+                    f.write(data)
+            except OSError as e:
+                logger.warning(f"Could not save {sidecar}: {e}; compressing again on the next start.")
+    return variants
+
+def precompress(build_dir):
+    # Write the .br/.gz variants of every compressible build file; run after `npm run build`
+    written = 0
+    for root, _, files in os.walk(build_dir):
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            full_path = os.path.join(root, name)
+            with open(full_path, 'rb') as f:
+                body = f.read()
+            if _compressible(name, body):
+                written += len(compressed_variants(full_path, body))
+    return written
+
+class Asset:
+    """
+    One build file held in memory with its precompressed variants, ETags and headers.
+    Each content coding is a different representation, so each has its own strong ETag.
+    """
+    def __init__(self, path, body, immutable, compressed):
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.body = body
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.etag = f'"{digest}"'
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        # {'br': bytes, 'gzip': bytes}, only variants that are actually smaller
+        self.encodings = {encoding: data for encoding, data in compressed.items()
+                          if data is not None and len(data) < len(body)}
+        self.etags = {encoding: f'"{digest}-{encoding}"' for encoding in self.encodings}
+
+    def select(self, accept_encoding):
+        # (body, encoding or None, etag) for the client's Accept-Encoding header
+        accepted = {part.split(';', 1)[0].strip() for part in accept_encoding.lower().split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and encoding in accepted:
+                return self.encodings[encoding], encoding, self.etags[encoding]
+        return self.body, None, self.etag
+
+class StaticAssets:
+    """
+    The React build, loaded once at startup: every file is read, compressed and hashed
+    here, so serving it is a dictionary lookup. Files listed in asset-manifest.json (or,
+    without one, files with a content hash in their name) are served as immutable.
+    Compressed variants come from the .gz/.br files next to each asset (see precompress);
+    missing or outdated ones are compressed once and written there.
+    """
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        self.assets = {}
+        self.index = None
+        if not os.path.isdir(build_dir):
+            logger.warning(f"No frontend build at {build_dir}; only the API is served.")
+            return
+
+        hashed = self._manifest_paths()
+        for root, _, files in os.walk(build_dir):
+            for name in files:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, build_dir).replace(os.sep, '/')
+                immutable = path in hashed if hashed is not None else \
+                    path.startswith('static/') and HASHED_NAME_PATTERN.search(name) is not None
+                self.assets[path] = self._load(path, full_path, immutable)
+        self.index = self.assets.get('index.html')
+        logger.info(f"Loaded {len(self.assets)} static assets from {build_dir}.")
+
+    def _manifest_paths(self):
+        # Paths of the hashed build output, or None without an asset-manifest.json
+        manifest_path = os.path.join(self.build_dir, 'asset-manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        paths = {url.lstrip('/') for url in manifest.get('files', {}).values()}
+        paths.update(path.lstrip('/') for path in manifest.get('entrypoints', []))
+        # The manifest lists index.html too, but its URL never changes
+        paths.discard('index.html')
+        return paths
+
+    def _load(self, path, full_path, immutable):
+        with open(full_path, 'rb') as f:
+            body = f.read()
+        compressed = compressed_variants(full_path, body) if _compressible(path, body) else {}
+        return Asset(path, body, immutable, compressed)
+
+    def get(self, path):
+        return self.assets.get(path)
+
+    def response(self, asset, request, response_class):
+        """
+        Response for an asset: the best precompressed variant the client accepts, or 304
+        when the client already holds that variant.
+        """
+        body, encoding, etag = asset.select(request.headers.get('Accept-Encoding', ''))
+        headers = {
+            'ETag': etag,
+            'Cache-Control': asset.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        # If-None-Match uses weak comparison: W/"x" matches "x"
+        candidates = {tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')}
+        if etag in candidates or '*' in candidates:
+            return response_class(status=304, headers=headers)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return response_class(body, status=200, headers=headers, mimetype=asset.content_type)
+
+if __name__ == "__main__":
+    # python -m utils.static_assets [build_dir]
+    logging.basicConfig(level=logging.INFO)
+    build_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), '..', '..', 'build')
+    logger.info(f"Wrote or verified {precompress(build_dir)} compressed variants in {build_dir}.")
@@ -0,0 +1,92 @@
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import nltk
+from nltk import pos_tag_sents
+from nltk.corpus import stopwords
+from nltk.corpus.reader.wordnet import ADJ, ADV, NOUN, VERB
+from nltk.stem import WordNetLemmatizer
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+# Map the first character of a Penn Treebank tag to the POS lemmatize() accepts
+TAG_MAP = {'J': ADJ, 'N': NOUN, 'V': VERB, 'R': ADV}
+LEMMA_CACHE_SIZE = 200000
+CHUNK_SIZE = 1000
+WORKERS = int(os.environ.get('RECOMMENDER_PREPROCESS_WORKERS', os.cpu_count() or 1))
+
+_stop_words = None
+_lemmatizer = None
+
+def ensure_nltk_resources():
+    # Download the corpora and tagger used below if they are missing
+    for resource, name in (('corpora/stopwords', 'stopwords'),
+                           ('corpora/wordnet', 'wordnet'),
+                           ('taggers/averaged_perceptron_tagger_eng', 'averaged_perceptron_tagger_eng')):
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(name)
+
+def _init_worker():
+    # Per-process stop words and lemmatizer (also used as the pool initializer)
+    global _stop_words, _lemmatizer
+    _stop_words = set(stopwords.words('english'))
+    _lemmatizer = WordNetLemmatizer()
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word, pos):
+    return _lemmatizer.lemmatize(word, pos)
+
+def preprocess_chunk(texts):
+    """
+    Lowercase, tokenize, remove stopwords and lemmatize a list of documents.
+    Each document is POS-tagged as one sentence and the whole chunk in a single
+    tagger call; lemmas are memoized per (word, POS).
+    """
+    if _lemmatizer is None:
+        _init_worker()
+    documents = [[w for w in WORD_PATTERN.findall(text.lower()) if w not in _stop_words] for text in texts]
+    tagged = pos_tag_sents(documents)
+    return [' '.join(lemmatize(word, TAG_MAP.get(tag[0].upper(), NOUN)) for word, tag in document)
+            for document in tagged]
+
+def preprocess_text(text):
+    return preprocess_chunk([text])[0]
+
+def preprocess_texts(texts, workers=WORKERS, chunk_size=CHUNK_SIZE):
+    """
+    Preprocess many documents, fanning chunks out over a process pool when workers > 1,
+    and log the throughput in rows per second.
+    """
+    ensure_nltk_resources()
+    start = time.perf_counter()
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    workers = max(1, min(workers, len(chunks)))
+    # A pool worker never starts its own pool (spawned workers re-import the app module)
+    if multiprocessing.parent_process() is not None:
+        workers = 1
+    results = None
+    if workers > 1:
+        # Fork where available: spawned workers re-run the importing module's top level
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+                results = list(pool.map(preprocess_chunk, chunks))
+        except BrokenProcessPool:
+            logger.warning("Preprocessing pool failed to start; preprocessing serially.")
+            workers = 1
+    if results is None:
+        results = [preprocess_chunk(chunk) for chunk in chunks]
+    processed = [text for chunk in results for text in chunk]
+
+    elapsed = time.perf_counter() - start
+    rate = len(processed) / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"Preprocessed {len(processed)} rows in {elapsed:.1f}s ({rate:.0f} rows/s, {workers} workers).")
+    return processed
@@ -0,0 +1,100 @@
+import numpy as np
+import os
+import threading
+from collections import Counter, OrderedDict
+
+MAX_USERS = int(os.environ.get('RECOMMENDER_PROFILE_CACHE_USERS', 10000))
+
+class UserProfiles:
+    """
+    Per-user profile vectors: the sum of the embeddings of the user's favourites.
+    A profile is built from the database on first use, then kept up to date by adding
+    or subtracting one vector per favourite change instead of being recomputed.
+    Favourites map to catalogue rows by title, so several can share a row; rows are
+    counted and a row's vector is in the sum while any favourite still maps to it.
+    Every profile records the user's favourites version it reflects; the version is
+    checked against the database before serving, so changes made by other processes
+    (or missed during a load) cause a reload. Least recently used profiles are dropped
+    beyond max_users.
+    """
+    def __init__(self, store, max_users=MAX_USERS):
+        self.store = store
+        self.max_users = max_users
+        self.profiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id, load_rows, load_version):
+        """
+        (normalized profile vector or None, favourite rows) for a user.
+        load_version(user_id) returns the user's current favourites version and
+        load_rows(user_id) their favourite catalogue rows, read when the version differs.
+        """
+        version = load_version(user_id)
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            if profile is not None and profile['version'] == version:
+                self.profiles.move_to_end(user_id)
+            else:
+                profile = None
+        if profile is None:
+            # The version is read before the rows: a change landing in between leaves the
+            # profile marked older than its rows, so it is reloaded again, never served stale
+            rows = Counter(load_rows(user_id))
+            total = np.zeros(self.store.vectors([0]).shape[1], dtype=np.float64)
+            if rows:
+                total += self.store.vectors(sorted(rows)).sum(axis=0, dtype=np.float64)
+            profile = {'sum': total, 'rows': rows, 'version': version}
+            with self.lock:
+                current = self.profiles.get(user_id)
+                # Keep a profile another request built or updated meanwhile if it is newer
+                if current is None or current['version'] < version:
+                    self.profiles[user_id] = profile
+                self.profiles.move_to_end(user_id)
+                while len(self.profiles) > self.max_users:
+                    self.profiles.popitem(last=False)
+
+        with self.lock:
+            rows = np.array(sorted(profile['rows']), dtype=np.intp)
+            norm = np.linalg.norm(profile['sum'])
+            vector = (profile['sum'] / norm).astype(np.float32) if rows.size and norm > 0 else None
+        return vector, rows
+
+    def _apply(self, user_id, rows, changed, version, added):
+        """
+        Fold a committed change into a cached profile. The change moved the user's version
+        from version - changed to version; a profile at any other version missed or already
+        holds something, so it is dropped and reloaded on next use instead.
+        """
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            if profile is None:
+                return
+            if profile['version'] != version - changed:
+                del self.profiles[user_id]
+                return
+            counts = profile['rows']
+            for row in rows:
+                if added:
+                    counts[row] += 1
+                    if counts[row] == 1:
+                        profile['sum'] += self.store.vectors([row])[0]
+                elif counts[row] > 0:
+                    counts[row] -= 1
+                    if counts[row] == 0:
+                        del counts[row]
+                        profile['sum'] -= self.store.vectors([row])[0]
+                else:
+                    # Removing a favourite this profile never counted: it is out of step
+                    del self.profiles[user_id]
+                    return
+            if not profile['rows']:
+                # Reset instead of carrying floating-point residue
+                profile['sum'][:] = 0.0
+            profile['version'] = version
+
+    def add(self, user_id, rows, changed, version):
+        # changed favourites were added (rows: those found in the catalogue), ending at version
+        self._apply(user_id, rows, changed, version, True)
+
+    def remove(self, user_id, rows, changed, version):
+        self._apply(user_id, rows, changed, version, False)
@@ -35,17 +35,17 @@ const FavoritesPage = () => {
     }
   }, [userId]);
 
-  const handleUnlike = (contentId) => {
+  const handleUnlike = (favorite) => {
     if (!userId) return;
 
     fetch('http://localhost:5000/favorites', {
       method: 'DELETE',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ user_id: userId, content_id: contentId }),
+      body: JSON.stringify({ user_id: userId, content_id: favorite.id, content_type: favorite.type.toLowerCase() }),
     })
       .then((res) => {
         if (res.ok) {
-          setFavorites((prevFavorites) => prevFavorites.filter(item => item.id !== contentId));
+          setFavorites((prevFavorites) => prevFavorites.filter(item => item !== favorite));
         } else {
           console.error("Error removing favorite");
         }
@@ -83,7 +83,7 @@ const FavoritesPage = () => {
                       link={item.link}
                       userId={userId}
                       isLiked={true}
-                      onLikeToggle={() => handleUnlike(item.id)}
+                      onLikeToggle={() => handleUnlike(item)}
                     />
                   </Grid>
                 ))}
@@ -101,7 +101,7 @@ const FavoritesPage = () => {
                       link={item.link}
                       userId={userId}
                       isLiked={true}
-                      onLikeToggle={() => handleUnlike(item.id)}
+                      onLikeToggle={() => handleUnlike(item)}
                     />
                   </Grid>
                 ))}
@@ -3,6 +3,9 @@ import { Grid, Container, Typography, Button, Box } from '@mui/material';
 import Card from '../components/Card/Card';
 import SearchAndFilters from '../components/Search/SearchAndFilters';
 
+// Movie and book ids overlap, so favorites are keyed by type and id
+const favoriteKey = (item) => `${item.type}:${item.id}`;
+
 const ShowcasePage = () => {
   const [content, setContent] = useState([]);
   const [favorites, setFavorites] = useState([]);
@@ -38,7 +41,7 @@ const ShowcasePage = () => {
     if (userId) {
       fetch(`http://localhost:5000/favorites?user_id=${userId}`)
         .then((res) => res.json())
-        .then((data) => setFavorites(data.map((item) => item.id)))
+        .then((data) => setFavorites(data.map(favoriteKey)))
         .catch((err) => console.error('Fetch Favorites Error:', err));
     }
   }, [userId]);
@@ -52,21 +55,22 @@ const ShowcasePage = () => {
     return () => observer.disconnect();
   }, []);
 
-  const handleLikeToggle = (contentId) => {
+  const handleLikeToggle = (item) => {
     if (!userId) return;
-    const isLiked = favorites.includes(contentId);
+    const key = favoriteKey(item);
+    const isLiked = favorites.includes(key);
     const method = isLiked ? 'DELETE' : 'POST';
 
     fetch('http://localhost:5000/favorites', {
       method: method,
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ user_id: userId, content_id: contentId }),
+      body: JSON.stringify({ user_id: userId, content_id: item.id, content_type: item.type.toLowerCase() }),
     })
       .then(() => {
         setFavorites((prevFavorites) =>
           isLiked
-            ? prevFavorites.filter((id) => id !== contentId)
-            : [...prevFavorites, contentId]
+            ? prevFavorites.filter((favorite) => favorite !== key)
+            : [...prevFavorites, key]
         );
       })
       .catch((err) => console.error('Error updating favorites:', err));
@@ -118,8 +122,8 @@ const ShowcasePage = () => {
                       contentId={item.id}
                       link={item.link}
                       userId={userId}
-                      isLiked={favorites.includes(item.id)}
-                      onLikeToggle={() => handleLikeToggle(item.id)}
+                      isLiked={favorites.includes(favoriteKey(item))}
+                      onLikeToggle={() => handleLikeToggle(item)}
                     />
                   </Grid>
                 ))}
@@ -145,8 +149,8 @@ const ShowcasePage = () => {
                       contentId={item.id}
                       link={item.link}
                       userId={userId}
-                      isLiked={favorites.includes(item.id)}
-                      onLikeToggle={() => handleLikeToggle(item.id)}
+                      isLiked={favorites.includes(favoriteKey(item))}
+                      onLikeToggle={() => handleLikeToggle(item)}
                     />
                   </Grid>
                 ))}